@@ -7,6 +7,7 @@ DROP TABLE IF EXISTS rating;
 DROP TABLE IF EXISTS request;
 DROP TABLE IF EXISTS floor;
 DROP TABLE IF EXISTS department;
+DROP TABLE IF EXISTS load_checkpoint;
 
 
 CREATE TABLE department(
@@ -70,6 +71,13 @@ CREATE TABLE rating_interaction(
     FOREIGN KEY (rating_id) REFERENCES rating(rating_id) ON DELETE CASCADE
 );
 
+CREATE TABLE load_checkpoint(
+    source_file VARCHAR(255) PRIMARY KEY,
+    row_offset INT NOT NULL CHECK (row_offset >= 0),
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE INDEX rating_interaction_idx ON rating_interaction(exhibition_id, rating_id);
 CREATE INDEX request_interaction_idx ON request_interaction(exhibition_id, request_id);
 CREATE INDEX exhibition_idx ON exhibition(department_id, floor_id);
@@ -0,0 +1,153 @@
+"""Adaptive batching of database writes, tuned at runtime from commit latency and errors."""
+import time
+import logging
+
+
+class AdaptiveBatchController:
+    """AIMD controller for batch size and flush interval.
+
+    Batches that commit within the target latency grow the batch size
+    additively and shorten the flush interval. Slow or failed batches cut
+    the batch size multiplicatively and lengthen the flush interval.
+    """
+
+    def __init__(self, target_latency: float = 0.5, initial_size: int = 50,
+                 min_size: int = 1, max_size: int = 5000, increase_step: int = 10,
+                 decrease_factor: float = 0.5, initial_interval: float = 1.0,
+                 min_interval: float = 0.1, max_interval: float = 10.0,
+                 smoothing: float = 0.2, log_every: int = 50):
+        self.target_latency = target_latency
+        self.min_size = min_size
+        self.max_size = max_size
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+        self.log_every = log_every
+
+        self.batch_size = max(min_size, min(initial_size, max_size))
+        self.flush_interval = max(min_interval, min(initial_interval, max_interval))
+        self.latency_avg = None
+        self.error_rate = 0.0
+        self.batches = 0
+        self.errors = 0
+        self.rows = 0
+        self.increases = 0
+        self.decreases = 0
+
+    def record(self, batch_size: int, latency: float, error: bool = False) -> None:
+        """Records the outcome of a batch and adjusts the next batch size and interval."""
+        self.batches += 1
+        if error:
+            self.errors += 1
+        else:
+            self.rows += batch_size
+
+        if self.latency_avg is None:
+            self.latency_avg = latency
+        else:
+            self.latency_avg += self.smoothing * (latency - self.latency_avg)
+        self.error_rate += self.smoothing * (float(error) - self.error_rate)
+
+        if error or latency > self.target_latency:
+            self.batch_size = max(self.min_size,
+                                  int(self.batch_size * self.decrease_factor))
+            self.flush_interval = min(self.max_interval,
+                                      self.flush_interval / self.decrease_factor)
+            self.decreases += 1
+        else:
+            self.batch_size = min(self.max_size,
+                                  self.batch_size + self.increase_step)
+            self.flush_interval = max(self.min_interval,
+                                      self.flush_interval - self.min_interval)
+            self.increases += 1
+
+        if self.log_every and self.batches % self.log_every == 0:
+            logging.info("Batch controller metrics: %s", self.metrics())
+        else:
+            logging.debug("Batch controller: %s", self.metrics())
+
+    def metrics(self) -> dict:
+        """Returns the controller's current decisions and observations."""
+        return {
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "target_latency": self.target_latency,
+            "latency_avg": self.latency_avg,
+            "error_rate": self.error_rate,
+            "batches": self.batches,
+            "errors": self.errors,
+            "rows": self.rows,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+class BatchWriter:
+    """Buffers entries and writes them to a sink in controller-sized batches.
+
+    Each entry may carry a position, such as its kafka offset, which is
+    handed to on_flush once the entry's batch has been written.
+    """
+
+    def __init__(self, sink, controller: AdaptiveBatchController,
+                 max_retries: int = 3, clock=time.monotonic, on_flush=None):
+        self.sink = sink
+        self.controller = controller
+        self.max_retries = max_retries
+        self.clock = clock
+        self.on_flush = on_flush
+        self.buffer = []
+        self.positions = []
+        self.oldest_at = None
+
+    def add(self, entry, position=None) -> None:
+        """Buffers an entry, flushing once a full batch is waiting."""
+        if not self.buffer:
+            self.oldest_at = self.clock()
+        self.buffer.append(entry)
+        self.positions.append(position)
+        if len(self.buffer) >= self.controller.batch_size:
+            self.flush_batch()
+
+    def is_due(self) -> bool:
+        """Whether the oldest buffered entry has waited for the flush interval."""
+        return bool(self.buffer) and \
+            self.clock() - self.oldest_at >= self.controller.flush_interval
+
+    def maybe_flush(self) -> None:
+        """Flushes a partial batch once the flush interval has elapsed."""
+        if self.is_due():
+            self.flush_batch()
+
+    def flush_batch(self) -> None:
+        """Writes one batch to the sink, retrying with smaller batches on failure."""
+        attempts = 0
+        while True:
+            batch = self.buffer[:self.controller.batch_size]
+            started = self.clock()
+            try:
+                self.sink(batch)
+            except Exception:
+                self.controller.record(len(batch), self.clock() - started, error=True)
+                attempts += 1
+                if attempts > self.max_retries:
+                    raise
+                logging.error("Batch of %s failed, retrying with %s",
+                              len(batch), self.controller.batch_size)
+                continue
+
+            self.controller.record(len(batch), self.clock() - started)
+            positions = self.positions[:len(batch)]
+            del self.buffer[:len(batch)]
+            del self.positions[:len(batch)]
+            if self.on_flush is not None:
+                self.on_flush(positions)
+            self.oldest_at = self.clock() if self.buffer else None
+            return
+
+    def flush(self) -> None:
+        """Writes every buffered entry."""
+        while self.buffer:
+            self.flush_batch()
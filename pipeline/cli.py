@@ -0,0 +1,42 @@
+"""Single entry point for the pipeline, importing each subcommand's dependencies only when run."""
+import argparse
+import importlib
+
+
+COMMANDS = {
+    "backfill": ("etl_pipeline", "Extract kiosk data from S3 and load it into the database"),
+    "consume": ("kafka_data_process", "Consume live kiosk data from kafka, or replay a capture"),
+    "extract": ("s3_data_download", "Download kiosk and exhibit files from S3"),
+    "bench": ("startup_bench", "Benchmark the startup time and memory of each subcommand"),
+    "load-bench": ("load_bench", "Benchmark row by row against batched loads on a local Postgres"),
+}
+
+
+def load_command(name: str):
+    """Imports the module behind a subcommand and returns its main function."""
+    module_name, _ = COMMANDS[name]
+    return importlib.import_module(module_name).main
+
+
+def parse_arguments(argv: list[str] = None):
+    """Parses the subcommand, leaving its own arguments to the subcommand."""
+    parser = argparse.ArgumentParser(
+        description="LMNH kiosk data pipeline.",
+        epilog="\n".join(f"  {name:<12}{help_text}"
+                         for name, (_, help_text) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=COMMANDS.keys(),
+                        help="Subcommand to run")
+    parser.add_argument("args", nargs=argparse.REMAINDER,
+                        help="Arguments for the subcommand, see <command> --help")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None):
+    """Runs the requested subcommand."""
+    args = parse_arguments(argv)
+    load_command(args.command)(args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# pylint: skip-file
+import os
+import pytest
+import psycopg2
+
+from pg_harness import (connect, build_template, clone_database, drop_database,
+                        worker_database_name, RollbackConnection)
+
+
+@pytest.fixture(scope="session")
+def pg_admin():
+    """Autocommit connection to the local test server, skipping when none is running."""
+    try:
+        admin_conn = connect(os.environ.get("TEST_DATABASE_ADMIN_NAME", "postgres"),
+                             autocommit=True)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Local Postgres not available: {e}")
+    build_template(admin_conn)
+    yield admin_conn
+    admin_conn.close()
+
+
+@pytest.fixture(scope="session")
+def pg_database(pg_admin):
+    """Database cloned from the template for this test worker."""
+    name = worker_database_name(os.environ.get("PYTEST_XDIST_WORKER", "main"))
+    clone_database(pg_admin, name)
+    yield name
+    drop_database(pg_admin, name)
+
+
+@pytest.fixture
+def pg_conn(pg_database):
+    """Connection whose changes are rolled back at the end of the test."""
+    conn = connect(pg_database)
+    yield RollbackConnection(conn)
+    conn.rollback()
+    conn.close()
+
+
+@pytest.fixture
+def pg_fresh_database(pg_admin, request):
+    """Database cloned from the template for a single test, for tests needing real commits."""
+    name = clone_database(pg_admin, worker_database_name(
+        f"{os.environ.get('PYTEST_XDIST_WORKER', 'main')}_{request.node.name}"[:40]))
+    yield name
+    drop_database(pg_admin, name)
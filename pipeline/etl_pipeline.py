@@ -1,27 +1,34 @@
 """Pipeline that extracts data from an s3 bucket, transforms it and uploads it to an RDS db."""
+import os
 import csv
 import logging
+from itertools import islice
 import argparse
 from os import environ
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import psycopg2
 import psycopg2.extras
 from psycopg2.extensions import connection, cursor
-from s3_data_download import get_files
+from s3_data_archive import (archive_file, archive_manifest, archive_rejects, get_compressor,
+                             RejectWriter)
+from batch_loader import AdaptiveBatchController, BatchWriter
+from profiling import profile_run, stage
 
 
-KIOSK_DATA_PATH = "../data/kiosk_data.csv"
 SCHEMA_FILE_PATH = "./schema.sql"
+REJECTS_DIR = "../data"
 LOGS_NAME = "./pipeline_logs.log"
 
 
-def load_csv(filepath: str) -> list[dict]:
-    """Loads the local csv file"""
+def load_csv(filepath: str, skip: int = 0) -> list[dict]:
+    """Loads the local csv file, skipping the first rows if asked"""
     logging.info("Loading data from %s", filepath)
     with open(filepath, encoding="utf-8") as f:
         reader = csv.DictReader(f)
         kiosk_data = []
-        for row in reader:
+        for row in islice(reader, skip, None):
             kiosk_data.append(row)
     logging.info("Loaded %s entries from CSV", len(kiosk_data))
     return kiosk_data
@@ -98,7 +105,7 @@ def import_request_interactions(event_at, request_id: int, exhibit_id: int,
         logging.info(
             "Imported request interaction for exhibit %s at %s", exhibit_id, event_at)
     except Exception as e:
-        cursor.connection.rollback()
+        conn.rollback()
         logging.error("Failed to import request interaction: %s", e)
         raise Exception("Error") from e
 
@@ -115,21 +122,158 @@ def import_rating_interactions(event_at, rating_id: int, exhibit_id: int,
         logging.info(
             "Imported rating interaction for exhibit %s at %s", exhibit_id, event_at)
     except Exception as e:
-        cursor.connection.rollback()
+        conn.rollback()
         logging.error("Failed to import rating interaction: %s", e)
         raise Exception("Error") from e
 
 
-def import_kiosk_data(entries: list[dict], conn, cursor, limit=None) -> None:
-    """Inserts kiosk data into the database"""
+def import_kiosk_data(entries: list[dict], conn, cursor, limit=None,
+                      controller: AdaptiveBatchController = None,
+                      source_file: str = None, start_offset: int = 0,
+                      rejects: RejectWriter = None) -> None:
+    """Inserts kiosk data into the database, in adaptive batches if given a controller.
+
+    Batches from a source file checkpoint their end row offset in the same
+    transaction, counting on from start_offset. Malformed entries in
+    batches go to rejects, if given.
+    """
     logging.info("Starting import of kiosk data")
 
-    for entry in entries[:limit]:
-        import_single_kiosk_data(entry, conn, cursor)
+    if controller is None:
+        for entry in entries[:limit]:
+            import_single_kiosk_data(entry, conn, cursor)
+    else:
+        writer = get_batch_writer(conn, cursor, controller,
+                                  source_file, start_offset, rejects=rejects)
+        for entry in entries[:limit]:
+            writer.add(entry)
+        writer.flush()
+        logging.info("Batch controller metrics: %s", controller.metrics())
 
     logging.info("Finished importing kiosk data")
 
 
+def split_kiosk_entries(entries: list[dict],
+                        rejected: list = None) -> tuple[list[tuple], list[tuple]]:
+    """Splits kiosk entries into request and rating rows
+
+    Malformed entries are added to rejected with the reason, if given, and
+    raise otherwise.
+    """
+    request_rows = []
+    rating_rows = []
+    for entry in entries:
+        try:
+            value_id = int(entry["val"])
+            exhibit_id = int(entry["site"]) + 1
+            request_type = int(float(entry["type"])) if value_id == -1 else None
+        except (KeyError, TypeError, ValueError) as e:
+            if rejected is None:
+                raise
+            rejected.append((entry, f"{type(e).__name__}: {e}"))
+            continue
+
+        if value_id == -1:
+            request_rows.append((exhibit_id, request_type, entry["at"]))
+        else:
+            rating_rows.append((exhibit_id, value_id, entry["at"]))
+    return request_rows, rating_rows
+
+
+def get_checkpoints(cursor) -> dict[str, dict]:
+    """Gets the row offset and completion of every checkpointed source file"""
+    cursor.execute("SELECT source_file, row_offset, completed FROM load_checkpoint")
+    checkpoints = {row["source_file"]: {"row_offset": row["row_offset"],
+                                        "completed": row["completed"]}
+                   for row in cursor.fetchall()}
+    logging.info("Found checkpoints for %s source files", len(checkpoints))
+    return checkpoints
+
+
+def save_checkpoint(source_file: str, row_offset: int, cursor,
+                    completed: bool = False) -> None:
+    """Records the row offset for a source file, leaving the commit to the caller"""
+    cursor.execute(
+        """INSERT INTO load_checkpoint (source_file, row_offset, completed)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (source_file) DO UPDATE
+        SET row_offset = EXCLUDED.row_offset, completed = EXCLUDED.completed,
+        updated_at = CURRENT_TIMESTAMP""",
+        (source_file, row_offset, completed))
+
+
+def complete_checkpoint(source_file: str, row_offset: int, conn, cursor) -> None:
+    """Marks a source file as fully loaded, so resumed runs skip it"""
+    save_checkpoint(source_file, row_offset, cursor, completed=True)
+    conn.commit()
+    logging.info("Finished loading %s at row %s", source_file, row_offset)
+
+
+def import_kiosk_batch(entries: list[dict], conn, cursor,
+                       checkpoint: tuple[str, int] = None,
+                       rejects: RejectWriter = None) -> None:
+    """Imports a batch of kiosk entries, and its checkpoint if given, in a single transaction
+
+    Rows whose rating value or request type has no lookup row fail the whole
+    batch, as they would on the row by row path, instead of being skipped.
+    Malformed entries go to rejects, if given, once the batch has committed.
+    """
+    rejected = [] if rejects is not None else None
+    request_rows, rating_rows = split_kiosk_entries(entries, rejected)
+    try:
+        if request_rows:
+            psycopg2.extras.execute_values(
+                cursor,
+                """INSERT INTO request_interaction (exhibition_id, request_id, event_at)
+                SELECT v.exhibition_id, r.request_id, v.event_at::timestamp
+                FROM (VALUES %s) AS v(exhibition_id, request_value, event_at)
+                JOIN request r ON r.request_value = v.request_value""",
+                request_rows, page_size=len(request_rows))
+            if cursor.rowcount != len(request_rows):
+                raise ValueError(f"{len(request_rows) - cursor.rowcount} of "
+                                 f"{len(request_rows)} requests have an unknown type")
+        if rating_rows:
+            psycopg2.extras.execute_values(
+                cursor,
+                """INSERT INTO rating_interaction (exhibition_id, rating_id, event_at)
+                SELECT v.exhibition_id, r.rating_id, v.event_at::timestamp
+                FROM (VALUES %s) AS v(exhibition_id, rating_value, event_at)
+                JOIN rating r ON r.rating_value = v.rating_value""",
+                rating_rows, page_size=len(rating_rows))
+            if cursor.rowcount != len(rating_rows):
+                raise ValueError(f"{len(rating_rows) - cursor.rowcount} of "
+                                 f"{len(rating_rows)} ratings have an unknown value")
+        if checkpoint is not None:
+            save_checkpoint(*checkpoint, cursor)
+        conn.commit()
+        logging.info("Imported batch of %s request and %s rating interactions",
+                     len(request_rows), len(rating_rows))
+        for entry, reason in rejected or []:
+            rejects.write(reason, entry, checkpoint[0] if checkpoint else None)
+        if rejected:
+            logging.warning("Rejected %s malformed entries", len(rejected))
+    except Exception as e:
+        conn.rollback()
+        logging.error("Failed to import kiosk batch: %s", e)
+        raise
+
+
+def get_batch_writer(conn, cursor, controller: AdaptiveBatchController,
+                     source_file: str = None, start_offset: int = 0,
+                     on_flush=None, rejects: RejectWriter = None) -> BatchWriter:
+    """Creates a batch writer that loads kiosk entries into the database"""
+    progress = {"row_offset": start_offset}
+
+    def sink(batch: list[dict]) -> None:
+        checkpoint = None
+        if source_file is not None:
+            checkpoint = (source_file, progress["row_offset"] + len(batch))
+        import_kiosk_batch(batch, conn, cursor, checkpoint, rejects)
+        progress["row_offset"] += len(batch)
+
+    return BatchWriter(sink, controller, on_flush=on_flush)
+
+
 def import_single_kiosk_data(entry: dict, conn, cursor) -> None:
     event_at = entry["at"]
     value_id = int(entry["val"])
@@ -157,7 +301,7 @@ def reset_database(schema_file_path: str, cursor, conn):
     logging.info("Database reset.")
 
 
-def parse_arguments():
+def parse_arguments(argv: list[str] = None):
     """Parses command-line arguments."""
     parser = argparse.ArgumentParser(
         description="Import kiosk data into the database.")
@@ -172,12 +316,50 @@ def parse_arguments():
         default=None,
         help="Number of rows to upload"
     )
+    parser.add_argument(
+        "--target-latency",
+        type=float,
+        default=0.5,
+        help="Target commit latency in seconds for adaptive batches"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume from the checkpoint of each source file instead of resetting the database"
+    )
+    parser.add_argument(
+        "--allow-restart",
+        action="store_true",
+        help="With --resume, reset the database and start over if there are no checkpoints"
+    )
+    parser.add_argument(
+        "--archive-bucket",
+        default=None,
+        help="Name of the AWS bucket to archive processed data and manifests to"
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["gzip", "zstd", "none"],
+        default="gzip",
+        help="Compression used for archived files"
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Profile the run, writing reports to this path prefix"
+    )
+    parser.add_argument(
+        "--profile-mode",
+        choices=["sample", "cprofile"],
+        default="sample",
+        help="Sampling profiler with flame graph output, or deterministic cProfile"
+    )
     parser.add_argument(
         "--logs",
         action="store_true",
         help="Output logs to a file instead of console"
     )
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def configure_logging(to_file: bool) -> None:
@@ -197,23 +379,153 @@ def configure_logging(to_file: bool) -> None:
         )
 
 
-def main():
-    """Calls all necessary functions for the pipeline"""
-    args = parse_arguments()
-    configure_logging(args.logs)
+def run_pipeline(args) -> None:
+    """Extracts, resets or resumes, and loads each kiosk file, tagging each stage"""
+    # boto3 is only needed here, so importers such as the consumer skip it
+    from s3_data_download import (setup_aws_session, list_kiosk_keys,
+                                  download_kiosk_file, get_exhibit_files)
 
-    get_files(args.bucket)
+    started_at = datetime.now()
+    if args.archive_bucket:
+        # Fails on a missing compression package before any data is loaded
+        get_compressor(args.compression)
+
+    session = setup_aws_session()
+    bucket = session.resource('s3').Bucket(args.bucket)
+    with stage("extract"):
+        kiosk_keys = list_kiosk_keys(bucket)
+        get_exhibit_files(bucket)
 
     conn = get_connection()
     cursor_ = get_cursor(conn)
 
-    reset_database(SCHEMA_FILE_PATH, cursor_, conn)
+    checkpoints = {}
+    if args.resume:
+        checkpoints = get_checkpoints(cursor_)
+        if not checkpoints and not args.allow_restart:
+            cursor_.close()
+            conn.close()
+            raise ValueError("No checkpoint to resume from, "
+                             "pass --allow-restart to start over")
+    if not checkpoints:
+        with stage("reset"):
+            reset_database(SCHEMA_FILE_PATH, cursor_, conn)
+
+    controller = AdaptiveBatchController(target_latency=args.target_latency)
+    s3_client = session.client('s3') if args.archive_bucket else None
+    rejects = RejectWriter(os.path.join(
+        REJECTS_DIR, f"rejects_{started_at.strftime('%Y%m%dT%H%M%S')}.jsonl"))
+    manifest = {
+        "bucket": args.bucket,
+        "status": "failed",
+        "error": None,
+        "started_at": started_at,
+        "files": [],
+        "archived": [],
+    }
+    try:
+        with ThreadPoolExecutor(max_workers=1) as archive_pool:
+            loaded = sum(checkpoint["row_offset"] for checkpoint in checkpoints.values())
+            for key in kiosk_keys:
+                checkpoint = checkpoints.get(key, {"row_offset": 0, "completed": False})
+                if checkpoint["completed"]:
+                    logging.info("Skipping %s, already loaded", key)
+                    continue
+                limit = None if args.limit is None else args.limit - loaded
+                if limit is not None and limit <= 0:
+                    break
+
+                with stage("extract"):
+                    file_path = download_kiosk_file(bucket, key)
+                with stage("read_csv"):
+                    kiosk_data = load_csv(file_path, checkpoint["row_offset"])
+                archived = None
+                if s3_client:
+                    archived = archive_pool.submit(
+                        archive_in_stage, s3_client, args.archive_bucket, file_path,
+                        "processed", started_at, args.compression, False)
+                try:
+                    with stage("load"):
+                        import_kiosk_data(kiosk_data, conn, cursor_, limit, controller,
+                                          key, checkpoint["row_offset"], rejects)
+                except Exception:
+                    if archived:
+                        discard_archive(s3_client, args.archive_bucket, archived)
+                    raise
+
+                rows = len(kiosk_data[:limit])
+                loaded += rows
+                if rows == len(kiosk_data):
+                    complete_checkpoint(key, checkpoint["row_offset"] + rows, conn, cursor_)
+                manifest["files"].append({"key": key, "start_offset": checkpoint["row_offset"],
+                                          "rows": rows})
+                if archived:
+                    manifest["archived"].append(archived.result())
+                    os.remove(file_path)
+        manifest["status"] = "succeeded"
+    except Exception as e:
+        manifest["error"] = str(e)
+        raise
+    finally:
+        cursor_.close()
+        conn.close()
+        rejects.close()
+        if s3_client:
+            manifest["finished_at"] = datetime.now()
+            manifest["batch_metrics"] = controller.metrics()
+            manifest["rejected_rows"] = rejects.count
+            manifest["rejected"] = write_rejects(s3_client, args.archive_bucket, rejects,
+                                                 started_at, args.compression)
+            write_manifest(s3_client, args.archive_bucket, manifest,
+                           started_at, args.compression)
+
+
+def archive_in_stage(*args) -> str:
+    """Archives a file from the archive thread, tagged as the archive stage"""
+    with stage("archive"):
+        return archive_file(*args)
+
+
+def discard_archive(s3_client, bucket: str, archived) -> None:
+    """Removes an archived copy of input whose load failed, keeping the local file"""
+    try:
+        key = archived.result()
+    except Exception as e:
+        logging.error("Archiving failed: %s", e)
+        return
+    s3_client.delete_object(Bucket=bucket, Key=key)
+    logging.info("Removed %s as the load failed", key)
+
+
+def write_rejects(s3_client, bucket: str, rejects: RejectWriter, started_at: datetime,
+                  compression: str) -> str | None:
+    """Archives the run's rejects, logging rather than raising if the upload fails"""
+    with stage("archive"):
+        try:
+            return archive_rejects(s3_client, bucket, rejects, started_at, compression)
+        except Exception as e:
+            logging.error("Failed to archive rejected rows: %s", e)
+            return None
+
+
+def write_manifest(s3_client, bucket: str, manifest: dict, started_at: datetime,
+                   compression: str) -> None:
+    """Archives the run manifest, logging rather than raising if the upload fails"""
+    with stage("archive"):
+        try:
+            archive_manifest(s3_client, bucket, manifest, started_at, compression)
+        except Exception as e:
+            logging.error("Failed to archive the run manifest: %s", e)
+
+
+def main(argv: list[str] = None):
+    """Calls all necessary functions for the pipeline"""
+    args = parse_arguments(argv)
+    configure_logging(args.logs)
 
-    kiosk_data = load_csv(KIOSK_DATA_PATH)
-    import_kiosk_data(kiosk_data, conn, cursor_, args.limit)
+    with profile_run(args.profile, args.profile_mode):
+        run_pipeline(args)
 
-    conn.close()
-    cursor_.close()
     logging.info("Data import process completed")
 
 
@@ -0,0 +1,266 @@
+"""Captures raw kafka messages to a segmented local log and replays them offline."""
+import os
+import mmap
+import time
+import struct
+import logging
+
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+SEGMENT_MAGIC = b"LMNHLOG1"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_FLUSH_RECORDS = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# partition, offset, timestamp (ms), topic length, key length, value length
+RECORD_HEADER = struct.Struct(">iqqHii")
+
+
+def segment_name(index: int) -> str:
+    """Returns the file name of the segment with the given index."""
+    return f"{SEGMENT_PREFIX}{index:08d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(log_dir: str) -> list[str]:
+    """Lists the segment files in a log directory in write order."""
+    if not os.path.isdir(log_dir):
+        return []
+    names = sorted(name for name in os.listdir(log_dir)
+                   if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(log_dir, name) for name in names]
+
+
+def segment_index(path: str) -> int:
+    """Returns the index encoded in a segment's file name."""
+    return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def encode_record(topic: str, partition: int, offset: int, timestamp: int,
+                  key: bytes | None, value: bytes | None) -> bytes:
+    """Encodes a single message as a length-prefixed record."""
+    topic_bytes = topic.encode("utf-8")
+    key_len = -1 if key is None else len(key)
+    value_len = -1 if value is None else len(value)
+    header = RECORD_HEADER.pack(partition, offset, timestamp,
+                                len(topic_bytes), key_len, value_len)
+    return header + topic_bytes + (key or b"") + (value or b"")
+
+
+def decode_records(buffer):
+    """Yields each record in a segment buffer in turn, skipping the magic header."""
+    if buffer[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+        raise ValueError("Not an event log segment")
+
+    position = len(SEGMENT_MAGIC)
+    end = len(buffer)
+    while position + RECORD_HEADER.size <= end:
+        partition, offset, timestamp, topic_len, key_len, value_len = \
+            RECORD_HEADER.unpack_from(buffer, position)
+        position += RECORD_HEADER.size
+        body_len = topic_len + max(key_len, 0) + max(value_len, 0)
+        if position + body_len > end:
+            logging.error("Truncated record at end of segment, stopping")
+            break
+
+        topic = bytes(buffer[position:position + topic_len]).decode("utf-8")
+        position += topic_len
+        key = None
+        if key_len >= 0:
+            key = bytes(buffer[position:position + key_len])
+            position += key_len
+        value = None
+        if value_len >= 0:
+            value = bytes(buffer[position:position + value_len])
+            position += value_len
+
+        yield topic, partition, offset, timestamp, key, value
+
+
+class EventLogWriter:
+    """Appends raw messages to size-bounded segment files."""
+
+    def __init__(self, log_dir: str, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 flush_records: int = DEFAULT_FLUSH_RECORDS,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, clock=time.monotonic):
+        self.log_dir = log_dir
+        self.segment_bytes = segment_bytes
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.clock = clock
+        os.makedirs(log_dir, exist_ok=True)
+        segments = list_segments(log_dir)
+        self.segment_index = segment_index(segments[-1]) + 1 if segments else 0
+        self.file = None
+        self.records_written = 0
+        self.unflushed = 0
+        self.flushed_at = clock()
+
+    def _open_segment(self) -> None:
+        """Starts a new segment file."""
+        path = os.path.join(self.log_dir, segment_name(self.segment_index))
+        self.file = open(path, "wb")
+        self.file.write(SEGMENT_MAGIC)
+        self.segment_index += 1
+        logging.info("Opened event log segment %s", path)
+
+    def append(self, topic: str, partition: int, offset: int, timestamp: int,
+               key: bytes | None, value: bytes | None) -> None:
+        """Writes a single message, rolling to a new segment when full."""
+        record = encode_record(topic, partition, offset, timestamp, key, value)
+        if self.file is None or self.file.tell() + len(record) > self.segment_bytes:
+            self.close()
+            self._open_segment()
+        self.file.write(record)
+        self.records_written += 1
+        self.unflushed += 1
+        self.flush_if_due()
+
+    def append_message(self, msg) -> None:
+        """Writes a consumed kafka message."""
+        _, timestamp = msg.timestamp()
+        self.append(msg.topic(), msg.partition(), msg.offset(), timestamp,
+                    msg.key(), msg.value())
+
+    def flush_if_due(self) -> None:
+        """Flushes once enough records are buffered or the flush interval has passed."""
+        if self.unflushed and (self.unflushed >= self.flush_records or
+                               self.clock() - self.flushed_at >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Flushes the current segment to disk."""
+        if self.file is not None:
+            self.file.flush()
+        self.unflushed = 0
+        self.flushed_at = self.clock()
+
+    def close(self) -> None:
+        """Closes the current segment."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class CapturingConsumer:
+    """Wraps a kafka consumer and tees every consumed message to an event log."""
+
+    def __init__(self, consumer, writer: EventLogWriter):
+        self.consumer = consumer
+        self.writer = writer
+
+    def poll(self, timeout=None):
+        """Polls the wrapped consumer, capturing any message received."""
+        msg = self.consumer.poll(timeout)
+        if msg is not None and not msg.error():
+            self.writer.append_message(msg)
+        else:
+            self.writer.flush_if_due()
+        return msg
+
+    def close(self) -> None:
+        """Closes the event log and the wrapped consumer."""
+        self.writer.close()
+        self.consumer.close()
+
+    def __getattr__(self, name):
+        return getattr(self.consumer, name)
+
+
+class ReplayMessage:
+    """Message read back from an event log, mirroring the kafka message API."""
+
+    def __init__(self, topic: str, partition: int, offset: int, timestamp: int,
+                 key: bytes | None, value: bytes | None):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._timestamp = timestamp
+        self._key = key
+        self._value = value
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+    def timestamp(self) -> tuple[int, int]:
+        return 1, self._timestamp
+
+    def key(self) -> bytes | None:
+        return self._key
+
+    def value(self) -> bytes | None:
+        return self._value
+
+    def error(self):
+        return None
+
+
+def read_log(log_dir: str):
+    """Yields every message in a log directory, decoding each segment in place via mmap."""
+    for path in list_segments(log_dir):
+        if os.path.getsize(path) <= len(SEGMENT_MAGIC):
+            continue
+        count = 0
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                for record in decode_records(buffer):
+                    count += 1
+                    yield ReplayMessage(*record)
+        logging.info("Read %s records from %s", count, path)
+
+
+class ReplayConsumer:
+    """Consumer-compatible source that replays an event log.
+
+    A speed of 1 replays at the original pace, N replays N times faster and
+    0 replays as fast as possible.
+    """
+
+    def __init__(self, log_dir: str, speed: float = 1.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.messages = read_log(log_dir)
+        self.speed = speed
+        self.clock = clock
+        self.sleep = sleep
+        self.first_timestamp = None
+        self.started_at = None
+        self.exhausted = False
+        self.replayed = 0
+
+    def _wait_for(self, timestamp: int) -> None:
+        """Sleeps until the message is due at the configured replay speed."""
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+            self.started_at = self.clock()
+            return
+        if self.speed <= 0:
+            return
+        due = self.started_at + (timestamp - self.first_timestamp) / 1000 / self.speed
+        delay = due - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+
+    def poll(self, timeout=None):
+        """Returns the next replayed message, or None once the log is exhausted."""
+        msg = next(self.messages, None)
+        if msg is None:
+            self.exhausted = True
+            return None
+        self._wait_for(msg.timestamp()[1])
+        self.replayed += 1
+        return msg
+
+    def subscribe(self, topics) -> None:
+        """Accepted for compatibility with the kafka consumer."""
+
+    def close(self) -> None:
+        """Stops replaying, releasing the segment being read."""
+        self.exhausted = True
+        self.messages.close()
+        logging.info("Replayed %s messages", self.replayed)
@@ -5,8 +5,13 @@ import argparse
 import json
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from confluent_kafka import Consumer
-from etl_pipeline import get_connection, get_cursor, import_single_kiosk_data
+from etl_pipeline import get_connection, get_cursor, import_single_kiosk_data, get_batch_writer
+from batch_loader import AdaptiveBatchController, BatchWriter
+from event_log import EventLogWriter, CapturingConsumer, ReplayConsumer
+from live_aggregates import (LiveAggregates, start_snapshot_writer, start_snapshot_server,
+                             write_snapshot)
+from s3_data_archive import RejectWriter, archive_rejects, get_compressor
+from profiling import profile_run, stage, start_periodic_sampling, install_signal_trigger
 
 
 TOPIC = "lmnh"
@@ -76,9 +81,14 @@ def validate_message(data: dict) -> tuple[bool, str]:
         return False, f"Missing key {e}"
 
 
-def process_message(consumer, conn, cursor):
-    """Processes a single message from the consumer."""
-    msg = consumer.poll(1.0)
+def process_message(consumer, conn, cursor, writer: BatchWriter = None,
+                    aggregates: LiveAggregates = None, rejects: RejectWriter = None):
+    """Processes a single message from the consumer, buffering it if given a batch writer.
+
+    Invalid messages are written to rejects, if given.
+    """
+    with stage("poll"):
+        msg = consumer.poll(1.0)
 
     if msg is None:
         print("Waiting...")
@@ -90,65 +100,237 @@ def process_message(consumer, conn, cursor):
     key = msg.key().decode("utf-8") if msg.key() is not None else None
     value = msg.value().decode("utf-8") if msg.value() is not None else None
 
-    value_dict = json.loads(value)
-    is_valid, message = validate_message(value_dict)
+    with stage("validate"):
+        value_dict = json.loads(value)
+        is_valid, message = validate_message(value_dict)
 
     if not is_valid:
         logging.error("Invalid: %s", message)
+        if rejects is not None:
+            rejects.write(message, value,
+                          f"{msg.topic()}:{msg.partition()}:{msg.offset()}")
         return None
 
     logging.info(f"""Consumed event from topic {
                  msg.topic()}: key = {key} value = {value}""")
 
-    import_single_kiosk_data(value_dict, conn, cursor)
+    with stage("load"):
+        if writer is None:
+            import_single_kiosk_data(value_dict, conn, cursor)
+        else:
+            writer.add(value_dict, (msg.topic(), msg.partition(), msg.offset()))
+
+    if aggregates is not None:
+        with stage("aggregate"):
+            aggregates.record(value_dict)
 
     return value_dict
 
 
-def consume_event(consumer: Consumer):
-    """Consumes data from kafka cluster, validates it and calls function to load it."""
+def commit_offsets(consumer, positions: list[tuple]) -> None:
+    """Commits the offsets after the given (topic, partition, offset) positions."""
+    from confluent_kafka import TopicPartition
+
+    latest = {}
+    for topic, partition, offset in positions:
+        latest[(topic, partition)] = max(offset, latest.get((topic, partition), offset))
+    consumer.commit(offsets=[TopicPartition(topic, partition, offset + 1)
+                             for (topic, partition), offset in latest.items()],
+                    asynchronous=False)
+    logging.info("Committed offsets %s", latest)
+
+
+def consume_event(consumer, controller: AdaptiveBatchController = None,
+                  aggregates: LiveAggregates = None, rejects: RejectWriter = None):
+    """Consumes data from kafka cluster, validates it and calls function to load it.
+
+    In batch mode, offsets are only committed once their batch is in the
+    database, so a crash replays buffered messages instead of losing them.
+    """
     conn = get_connection()
     cursor = get_cursor(conn)
+    writer = None
+    if controller:
+        writer = get_batch_writer(
+            conn, cursor, controller,
+            on_flush=lambda positions: commit_offsets(consumer, positions))
 
-    while True:
-        process_message(consumer, conn, cursor)
+    try:
+        while True:
+            process_message(consumer, conn, cursor, writer, aggregates, rejects)
+            if writer is not None:
+                writer.maybe_flush()
+    except KeyboardInterrupt:
+        if writer is not None:
+            writer.flush()
+        raise
+    finally:
+        # After a failure the buffer is left unflushed, as its offsets are
+        # uncommitted and retrying against a failing database only buries the error
+        if writer is not None:
+            logging.info("Batch controller metrics: %s", controller.metrics())
+        cursor.close()
+        conn.close()
 
 
-if __name__ == "__main__":
+def replay_events(consumer: ReplayConsumer, controller: AdaptiveBatchController = None,
+                  aggregates: LiveAggregates = None, rejects: RejectWriter = None):
+    """Loads every message from a replayed event log, stopping once it is exhausted."""
+    conn = get_connection()
+    cursor = get_cursor(conn)
+    writer = get_batch_writer(conn, cursor, controller) if controller else None
 
-    load_dotenv('.env.kafka')
+    try:
+        while not consumer.exhausted:
+            process_message(consumer, conn, cursor, writer, aggregates, rejects)
+            if writer is not None:
+                writer.maybe_flush()
+
+        if writer is not None:
+            writer.flush()
+            logging.info("Batch controller metrics: %s", controller.metrics())
+    finally:
+        cursor.close()
+        conn.close()
 
+
+def parse_arguments(argv: list[str] = None):
+    """Parses command-line arguments."""
     parser = argparse.ArgumentParser(description="consume messages")
     parser.add_argument("--logs", action="store_true",
                         help="Output logs to a file")
+    parser.add_argument("--capture", default=None,
+                        help="Directory to capture consumed messages to")
+    parser.add_argument("--replay", default=None,
+                        help="Directory of a captured event log to replay instead of kafka")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed multiplier, 0 replays as fast as possible")
+    parser.add_argument("--batch", action="store_true",
+                        help="Load messages in adaptively sized batches")
+    parser.add_argument("--target-latency", type=float, default=0.5,
+                        help="Target commit latency in seconds for adaptive batches")
+    parser.add_argument("--live-snapshot", default=None,
+                        help="JSON file to periodically write live aggregates to")
+    parser.add_argument("--live-port", type=int, default=None,
+                        help="Local port to serve live aggregates on")
+    parser.add_argument("--rejects", default=None,
+                        help="JSON lines file to write invalid messages to")
+    parser.add_argument("--archive-bucket", default=None,
+                        help="AWS bucket to archive the rejects file to on shutdown")
+    parser.add_argument("--compression", choices=["gzip", "zstd", "none"], default="gzip",
+                        help="Compression used for the archived rejects file")
+    parser.add_argument("--profile", default=None,
+                        help="Profile the whole run, writing reports to this path prefix")
+    parser.add_argument("--profile-mode", choices=["sample", "cprofile"], default="sample",
+                        help="Sampling profiler with flame graph output, or deterministic cProfile")
+    parser.add_argument("--profile-dir", default=None,
+                        help="Directory for periodic and on-demand (SIGUSR1) samples")
+    parser.add_argument("--profile-every", type=float, default=None,
+                        help="Seconds between periodic samples")
+    parser.add_argument("--profile-duration", type=float, default=10.0,
+                        help="Seconds each periodic or on-demand sample runs for")
+    return parser.parse_args(argv)
+
+
+def get_kafka_config(batch: bool = False) -> dict:
+    """Builds the kafka consumer config from the environment.
+
+    Batched consumers commit offsets themselves after each flush.
+    """
+    load_dotenv('.env.kafka')
 
-    args = parser.parse_args()
-
-    setup_logging(args.logs)
-
-    bootstrap_servers = environ['BOOTSTRAP_SERVERS']
-    security_protocol = environ['SECURITY_PROTOCOL']
-    sasl_mechanism = environ['SASL_MECHANISM']
-    sasl_username = environ['USERNAME']
-    sasl_password = environ['PASSWORD']
-
-    kafka_config = {
-        'bootstrap.servers': bootstrap_servers,
-        'security.protocol': security_protocol,
-        'sasl.mechanisms': sasl_mechanism,
-        'sasl.username': sasl_username,
-        'sasl.password': sasl_password,
+    config = {
+        'bootstrap.servers': environ['BOOTSTRAP_SERVERS'],
+        'security.protocol': environ['SECURITY_PROTOCOL'],
+        'sasl.mechanisms': environ['SASL_MECHANISM'],
+        'sasl.username': environ['USERNAME'],
+        'sasl.password': environ['PASSWORD'],
         'group.id': 'c14-qasim-consumer',
         'auto.offset.reset': 'earliest',
     }
+    if batch:
+        config['enable.auto.commit'] = False
+    return config
 
-    consumer_ = Consumer(kafka_config)
 
-    consumer_.subscribe([TOPIC])
+def archive_consumer_rejects(rejects: RejectWriter, bucket_name: str,
+                             compression: str) -> None:
+    """Closes the rejects file and archives it, if anything was rejected."""
+    rejects.close()
+    if bucket_name is None or not rejects.count:
+        return
+    # boto3 is only needed to archive rejects, so other runs skip it
+    from s3_data_download import setup_aws_session
 
     try:
-        consume_event(consumer_)
-    except KeyboardInterrupt:
-        pass
+        archive_rejects(setup_aws_session().client('s3'), bucket_name, rejects,
+                        compression=compression)
+    except Exception as e:
+        logging.error("Failed to archive rejected messages: %s", e)
+
+
+def main(argv: list[str] = None):
+    """Consumes from kafka, or replays a captured event log."""
+    args = parse_arguments(argv)
+
+    setup_logging(args.logs)
+    if args.archive_bucket:
+        # Fails on a missing compression package before consuming anything
+        get_compressor(args.compression)
+    rejects = RejectWriter(args.rejects) if args.rejects else None
+
+    controller = None
+    if args.batch:
+        controller = AdaptiveBatchController(target_latency=args.target_latency)
+
+    aggregates = None
+    snapshot_stopped = None
+    if args.live_snapshot or args.live_port:
+        aggregates = LiveAggregates(controller=controller)
+        if args.live_snapshot:
+            snapshot_stopped = start_snapshot_writer(aggregates, args.live_snapshot)
+        if args.live_port:
+            start_snapshot_server(aggregates, args.live_port)
+
+    if args.profile_dir:
+        install_signal_trigger(args.profile_dir, args.profile_duration)
+        if args.profile_every:
+            start_periodic_sampling(args.profile_dir, args.profile_every,
+                                    args.profile_duration)
+
+    try:
+        with profile_run(args.profile, args.profile_mode):
+            if args.replay:
+                consumer_ = ReplayConsumer(args.replay, speed=args.speed)
+                try:
+                    replay_events(consumer_, controller, aggregates, rejects)
+                finally:
+                    consumer_.close()
+                return
+
+            # confluent_kafka is only needed against a live cluster, not for replays
+            from confluent_kafka import Consumer
+
+            consumer_ = Consumer(get_kafka_config(args.batch))
+            if args.capture:
+                consumer_ = CapturingConsumer(consumer_, EventLogWriter(args.capture))
+
+            consumer_.subscribe([TOPIC])
+
+            try:
+                consume_event(consumer_, controller, aggregates, rejects)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                consumer_.close()
     finally:
-        consumer_.close()
+        if snapshot_stopped is not None:
+            # A run shorter than the snapshot interval would otherwise leave no file
+            snapshot_stopped.set()
+            write_snapshot(aggregates, args.live_snapshot)
+        if rejects is not None:
+            archive_consumer_rejects(rejects, args.archive_bucket, args.compression)
+
+
+if __name__ == "__main__":
+    main()
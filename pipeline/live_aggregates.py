@@ -0,0 +1,203 @@
+"""In-memory sliding-window aggregates of kiosk events for live dashboards."""
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+RATING_WINDOW_MINUTES = 60
+REQUEST_WINDOW_MINUTES = 5
+ASSISTANCE = 0
+EMERGENCY = 1
+
+
+class SiteWindow:
+    """Ring buffer of per-minute counts and sums for a single site."""
+
+    def __init__(self, minutes: int):
+        self.minutes = minutes
+        self.slot_minute = [-1] * minutes
+        self.rating_count = [0] * minutes
+        self.rating_sum = [0] * minutes
+        self.assistance = [0] * minutes
+        self.emergencies = [0] * minutes
+        self.newest_minute = -1
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def _slot(self, minute: int) -> int | None:
+        """Finds the slot for a minute, clearing it if it still holds an older minute.
+
+        Returns None for events that arrive after their minute has left the
+        window, so a late event never wipes the counts of a newer minute.
+        """
+        slot = minute % self.minutes
+        if minute <= self.newest_minute - self.minutes or minute < self.slot_minute[slot]:
+            self.dropped += 1
+            logging.debug("Dropped event for minute %s, newest is %s",
+                          minute, self.newest_minute)
+            return None
+        self.newest_minute = max(self.newest_minute, minute)
+        if self.slot_minute[slot] != minute:
+            self.slot_minute[slot] = minute
+            self.rating_count[slot] = 0
+            self.rating_sum[slot] = 0
+            self.assistance[slot] = 0
+            self.emergencies[slot] = 0
+        return slot
+
+    def add_rating(self, minute: int, value: int) -> bool:
+        """Counts a rating in its minute, returning whether it was accepted."""
+        with self.lock:
+            slot = self._slot(minute)
+            if slot is None:
+                return False
+            self.rating_count[slot] += 1
+            self.rating_sum[slot] += value
+            return True
+
+    def add_request(self, minute: int, request_type: int) -> bool:
+        """Counts an assistance or emergency request, returning whether it was accepted."""
+        with self.lock:
+            slot = self._slot(minute)
+            if slot is None:
+                return False
+            if request_type == EMERGENCY:
+                self.emergencies[slot] += 1
+            else:
+                self.assistance[slot] += 1
+            return True
+
+    def totals(self, now_minute: int, minutes: int) -> dict:
+        """Sums the buckets of the last given number of minutes up to now."""
+        totals = {"ratings": 0, "rating_sum": 0, "assistance": 0, "emergencies": 0}
+        with self.lock:
+            for slot, minute in enumerate(self.slot_minute):
+                if now_minute - minutes < minute <= now_minute:
+                    totals["ratings"] += self.rating_count[slot]
+                    totals["rating_sum"] += self.rating_sum[slot]
+                    totals["assistance"] += self.assistance[slot]
+                    totals["emergencies"] += self.emergencies[slot]
+        return totals
+
+
+class LiveAggregates:
+    """Per-site sliding-window aggregates, sharded so each site has its own lock."""
+
+    def __init__(self, rating_window: int = RATING_WINDOW_MINUTES,
+                 request_window: int = REQUEST_WINDOW_MINUTES, clock=time.time,
+                 controller=None):
+        self.rating_window = rating_window
+        self.request_window = request_window
+        self.clock = clock
+        self.controller = controller
+        self.shards = {}
+        self.shards_lock = threading.Lock()
+        self.events = 0
+        self.dropped = 0
+
+    def _shard(self, site: str) -> SiteWindow:
+        """Gets the window of a site, creating it on first use."""
+        shard = self.shards.get(site)
+        if shard is None:
+            with self.shards_lock:
+                shard = self.shards.setdefault(
+                    site, SiteWindow(max(self.rating_window, self.request_window)))
+        return shard
+
+    def record(self, event: dict) -> None:
+        """Adds a validated kiosk event to its site's minute, unless it arrived too late."""
+        minute = int(datetime.fromisoformat(event["at"]).timestamp() // 60)
+        shard = self._shard(str(event["site"]))
+        value = int(event["val"])
+        if value == -1:
+            accepted = shard.add_request(minute, int(float(event["type"])))
+        else:
+            accepted = shard.add_rating(minute, value)
+        if accepted:
+            self.events += 1
+        else:
+            self.dropped += 1
+
+    def snapshot(self) -> dict:
+        """Returns the current aggregates of every site."""
+        now = self.clock()
+        now_minute = int(now // 60)
+        sites = {}
+        for site, shard in sorted(self.shards.items()):
+            ratings = shard.totals(now_minute, self.rating_window)
+            requests = shard.totals(now_minute, self.request_window)
+            sites[site] = {
+                "exhibition_id": int(site) + 1,
+                "ratings": ratings["ratings"],
+                "average_rating": (ratings["rating_sum"] / ratings["ratings"]
+                                   if ratings["ratings"] else None),
+                "assistance_requests": requests["assistance"],
+                "emergencies": requests["emergencies"],
+            }
+        snapshot = {
+            "generated_at": datetime.fromtimestamp(now).isoformat(),
+            "rating_window_minutes": self.rating_window,
+            "request_window_minutes": self.request_window,
+            "events": self.events,
+            "dropped": self.dropped,
+            "sites": sites,
+        }
+        if self.controller is not None:
+            snapshot["batch_controller"] = self.controller.metrics()
+        return snapshot
+
+
+def write_snapshot(aggregates: LiveAggregates, file_path: str) -> None:
+    """Writes a snapshot to a JSON file, replacing it atomically."""
+    # Each thread has its own temp file, so a final write can overlap a periodic one
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(aggregates.snapshot(), f)
+    os.replace(temp_path, file_path)
+
+
+def start_snapshot_writer(aggregates: LiveAggregates, file_path: str,
+                          interval: float = 1.0) -> threading.Event:
+    """Writes snapshots in a background thread until the returned event is set."""
+    stopped = threading.Event()
+
+    def run() -> None:
+        while not stopped.wait(interval):
+            try:
+                write_snapshot(aggregates, file_path)
+            except OSError as e:
+                logging.error("Failed to write live snapshot: %s", e)
+
+    threading.Thread(target=run, name="snapshot-writer", daemon=True).start()
+    logging.info("Writing live snapshots to %s every %ss", file_path, interval)
+    return stopped
+
+
+def start_snapshot_server(aggregates: LiveAggregates, port: int,
+                          host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves snapshots as JSON over HTTP from a background thread."""
+
+    class SnapshotHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/snapshot"):
+                self.send_error(404)
+                return
+            body = json.dumps(aggregates.snapshot()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug("Snapshot server: " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), SnapshotHandler)
+    threading.Thread(target=server.serve_forever, name="snapshot-server",
+                     daemon=True).start()
+    logging.info("Serving live snapshots on http://%s:%s/snapshot", host, port)
+    return server
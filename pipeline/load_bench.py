@@ -0,0 +1,80 @@
+"""Benchmarks loading kiosk data row by row against adaptive batches, on a local Postgres."""
+import os
+import argparse
+from time import perf_counter
+import psycopg2.extras
+
+from pg_harness import connect, build_template, clone_database, drop_database
+from batch_loader import AdaptiveBatchController
+from etl_pipeline import import_kiosk_data
+
+
+BENCH_DATABASE_NAME = "lmnh_load_bench"
+
+
+def make_entries(count: int) -> list[dict]:
+    """Builds synthetic kiosk entries cycling through every rating, request and site."""
+    return [{"at": f"2024-10-22 {10 + i % 8:02d}:{i % 60:02d}:00",
+             "val": str(i % 6 - 1), "type": str(i % 2), "site": str(i % 6)}
+            for i in range(count)]
+
+
+def measure_load(conn, entries: list[dict],
+                 controller: AdaptiveBatchController = None) -> dict:
+    """Loads the entries, returning the time taken and rows per second."""
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    started = perf_counter()
+    import_kiosk_data(entries, conn, cursor, controller=controller,
+                      source_file="load_bench.csv" if controller else None)
+    elapsed = perf_counter() - started
+    cursor.close()
+    return {
+        "mode": "batched" if controller else "row by row",
+        "rows": len(entries),
+        "seconds": elapsed,
+        "rows_per_second": len(entries) / elapsed,
+    }
+
+
+def format_results(results: list[dict]) -> str:
+    """Formats benchmark results as a table."""
+    lines = [f"{'mode':<12}{'rows':>8}{'seconds':>10}{'rows/s':>10}"]
+    for result in results:
+        lines.append(f"{result['mode']:<12}{result['rows']:>8}"
+                     f"{result['seconds']:>10.2f}{result['rows_per_second']:>10.0f}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] = None):
+    """Compares row by row and batched loads in a fresh copy of the schema."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark row by row against batched kiosk data loads.")
+    parser.add_argument("--rows", type=int, default=5000,
+                        help="Rows to load in batches")
+    parser.add_argument("--row-by-row-rows", type=int, default=500,
+                        help="Rows to load one at a time")
+    parser.add_argument("--target-latency", type=float, default=0.5,
+                        help="Target commit latency in seconds for adaptive batches")
+    args = parser.parse_args(argv)
+
+    admin_conn = connect(os.environ.get("TEST_DATABASE_ADMIN_NAME", "postgres"),
+                         autocommit=True)
+    build_template(admin_conn)
+    clone_database(admin_conn, BENCH_DATABASE_NAME)
+    try:
+        conn = connect(BENCH_DATABASE_NAME)
+        controller = AdaptiveBatchController(target_latency=args.target_latency)
+        results = [measure_load(conn, make_entries(args.row_by_row_rows)),
+                   measure_load(conn, make_entries(args.rows), controller)]
+        conn.close()
+    finally:
+        drop_database(admin_conn, BENCH_DATABASE_NAME)
+        admin_conn.close()
+
+    print(format_results(results))
+    print(f"controller: {controller.metrics()}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
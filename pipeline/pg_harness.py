@@ -0,0 +1,158 @@
+"""Builds test databases from a schema template on a local Postgres for integration tests."""
+import os
+import re
+import hashlib
+import logging
+import psycopg2
+from psycopg2 import sql
+
+
+SCHEMA_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "database", "schema.sql")
+TEMPLATE_NAME = "lmnh_template"
+TEMPLATE_LOCK_ID = 7041
+
+
+def get_connection_params(dbname: str) -> dict:
+    """Connection parameters for the local test server, overridable from the environment."""
+    return {
+        "dbname": dbname,
+        "user": os.environ.get("TEST_DATABASE_USERNAME", "postgres"),
+        "password": os.environ.get("TEST_DATABASE_PASSWORD", "postgres"),
+        "host": os.environ.get("TEST_DATABASE_IP", "localhost"),
+        "port": os.environ.get("TEST_DATABASE_PORT", "5432"),
+    }
+
+
+def connect(dbname: str, autocommit: bool = False):
+    """Connects to a database on the local test server."""
+    conn = psycopg2.connect(connect_timeout=3, **get_connection_params(dbname))
+    conn.autocommit = autocommit
+    return conn
+
+
+def schema_checksum(schema_file_path: str = SCHEMA_FILE_PATH) -> str:
+    """Hashes the schema so the template is only rebuilt when it changes."""
+    with open(schema_file_path, "rb") as schema:
+        return hashlib.sha256(schema.read()).hexdigest()
+
+
+def worker_database_name(worker_id: str) -> str:
+    """Names the database cloned for a test worker."""
+    return f"lmnh_test_{re.sub(r'[^a-z0-9_]', '_', worker_id.lower())}"
+
+
+def get_template_checksum(admin_conn) -> str | None:
+    """Reads the schema checksum stored as the template's comment."""
+    with admin_conn.cursor() as cursor:
+        cursor.execute(
+            """SELECT shobj_description(oid, 'pg_database') FROM pg_database
+            WHERE datname = %s""", (TEMPLATE_NAME,))
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def drop_database(admin_conn, name: str) -> None:
+    """Drops a database, disconnecting anyone still using it."""
+    with admin_conn.cursor() as cursor:
+        cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(
+            sql.Identifier(name)))
+
+
+def build_template(admin_conn, schema_file_path: str = SCHEMA_FILE_PATH) -> None:
+    """Creates the template database from the schema, unless it is already current.
+
+    An advisory lock lets parallel test workers share a single build.
+    """
+    checksum = schema_checksum(schema_file_path)
+    with admin_conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (TEMPLATE_LOCK_ID,))
+    try:
+        if get_template_checksum(admin_conn) == checksum:
+            return
+
+        logging.info("Building template database %s", TEMPLATE_NAME)
+        drop_database(admin_conn, TEMPLATE_NAME)
+        with admin_conn.cursor() as cursor:
+            cursor.execute(sql.SQL("CREATE DATABASE {}").format(
+                sql.Identifier(TEMPLATE_NAME)))
+
+        conn = connect(TEMPLATE_NAME)
+        try:
+            with open(schema_file_path, encoding="utf-8") as schema:
+                with conn.cursor() as cursor:
+                    cursor.execute(schema.read())
+            conn.commit()
+        finally:
+            conn.close()
+
+        with admin_conn.cursor() as cursor:
+            cursor.execute(sql.SQL("COMMENT ON DATABASE {} IS {}").format(
+                sql.Identifier(TEMPLATE_NAME), sql.Literal(checksum)))
+    finally:
+        with admin_conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (TEMPLATE_LOCK_ID,))
+
+
+def clone_database(admin_conn, name: str) -> str:
+    """Creates a fresh copy of the template database."""
+    drop_database(admin_conn, name)
+    with admin_conn.cursor() as cursor:
+        cursor.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+            sql.Identifier(name), sql.Identifier(TEMPLATE_NAME)))
+    logging.info("Cloned %s from %s", name, TEMPLATE_NAME)
+    return name
+
+
+class RollbackCursor:
+    """Cursor wrapper whose connection is the RollbackConnection that opened it."""
+
+    def __init__(self, cursor, connection):
+        self.cursor = cursor
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class RollbackConnection:
+    """Connection wrapper that keeps a test inside one transaction.
+
+    Commits and rollbacks made by the code under test become savepoint
+    releases and rollbacks, and everything is rolled back when the test ends.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.savepoint()
+
+    def savepoint(self) -> None:
+        with self.conn.cursor() as cursor:
+            cursor.execute("SAVEPOINT test_savepoint")
+
+    def cursor(self, *args, **kwargs):
+        return RollbackCursor(self.conn.cursor(*args, **kwargs), self)
+
+    def commit(self) -> None:
+        with self.conn.cursor() as cursor:
+            cursor.execute("RELEASE SAVEPOINT test_savepoint")
+        self.savepoint()
+
+    def rollback(self) -> None:
+        with self.conn.cursor() as cursor:
+            cursor.execute("ROLLBACK TO SAVEPOINT test_savepoint")
+
+    def close(self) -> None:
+        """Left to the fixture, which rolls back the whole test."""
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
@@ -0,0 +1,247 @@
+"""Profiling hooks that tag time by pipeline stage and write flame-graph ready output."""
+import os
+import sys
+import time
+import pstats
+import signal
+import logging
+import cProfile
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+
+DEFAULT_INTERVAL = 0.005
+DEFAULT_TOP_N = 25
+NO_STAGE = "(no stage)"
+
+_active_stages = {}
+stage_times = defaultdict(float)
+_stage_times_lock = threading.Lock()
+
+
+@contextmanager
+def stage(name: str):
+    """Tags the current thread with a pipeline stage and times it."""
+    thread_id = threading.get_ident()
+    stack = _active_stages.setdefault(thread_id, [])
+    stack.append(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _stage_times_lock:
+            stage_times[name] += elapsed
+        stack.pop()
+
+
+def current_stage(thread_id: int) -> str:
+    """Returns the innermost stage a thread is in."""
+    stack = _active_stages.get(thread_id)
+    return stack[-1] if stack else NO_STAGE
+
+
+def frame_label(frame) -> str:
+    """Labels a frame as function (file:line)."""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def frame_stack(frame) -> list[str]:
+    """Returns the labels of a frame's call stack, outermost first."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class SamplingProfiler:
+    """Samples thread stacks from a background thread.
+
+    Only the main thread and threads inside a stage are sampled, so idle
+    helper threads such as the snapshot writer do not drown out the run.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.samples = Counter()
+        self.sample_count = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self) -> None:
+        """Records the current stack of each sampled thread, rooted at its stage."""
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != self.thread_id and not _active_stages.get(thread_id):
+                continue
+            stack = [f"stage:{current_stage(thread_id)}"] + frame_stack(frame)
+            self.samples[";".join(stack)] += 1
+        self.sample_count += 1
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def start(self) -> None:
+        """Starts sampling."""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler",
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops sampling."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def collapsed(self) -> str:
+        """Returns the samples as collapsed stacks, ready for flamegraph.pl or speedscope."""
+        return "\n".join(f"{stack} {count}"
+                         for stack, count in self.samples.most_common()) + "\n"
+
+    def top(self, n: int = DEFAULT_TOP_N) -> list[tuple[str, int, int]]:
+        """Returns the hottest functions by self samples, with their total samples."""
+        self_samples = Counter()
+        total_samples = Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            self_samples[frames[-1]] += count
+            for frame in set(frames):
+                total_samples[frame] += count
+        return [(frame, count, total_samples[frame])
+                for frame, count in self_samples.most_common(n)]
+
+    def stage_samples(self) -> Counter:
+        """Returns the samples taken in each stage."""
+        stages = Counter()
+        for stack, count in self.samples.items():
+            stages[stack.split(";", 1)[0].removeprefix("stage:")] += count
+        return stages
+
+    def report(self, n: int = DEFAULT_TOP_N) -> str:
+        """Formats a top-N hot function report with a per-stage breakdown."""
+        total = sum(self.samples.values()) or 1
+        lines = [f"{self.sample_count} samples every {self.interval * 1000:.1f}ms", "",
+                 f"{'stage':<30}{'samples':>10}{'%':>8}"]
+        for name, count in self.stage_samples().most_common():
+            lines.append(f"{name:<30}{count:>10}{100 * count / total:>8.1f}")
+        lines += ["", f"{'self':>8}{'total':>8}  function"]
+        for frame, self_count, total_count in self.top(n):
+            lines.append(f"{self_count:>8}{total_count:>8}  {frame}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_prefix: str, n: int = DEFAULT_TOP_N) -> None:
+        """Writes the collapsed stacks and top-N report next to each other."""
+        os.makedirs(os.path.dirname(output_prefix) or ".", exist_ok=True)
+        with open(f"{output_prefix}.collapsed", "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        with open(f"{output_prefix}.top.txt", "w", encoding="utf-8") as f:
+            f.write(self.report(n))
+        logging.info("Wrote profile to %s.collapsed and %s.top.txt",
+                     output_prefix, output_prefix)
+
+
+def format_stage_times() -> str:
+    """Formats the wall time spent in each stage."""
+    lines = [f"{'stage':<30}{'seconds':>12}"]
+    with _stage_times_lock:
+        times = list(stage_times.items())
+    for name, seconds in sorted(times, key=lambda item: -item[1]):
+        lines.append(f"{name:<30}{seconds:>12.3f}")
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profile_run(output_prefix: str = None, mode: str = "sample",
+                interval: float = DEFAULT_INTERVAL, top_n: int = DEFAULT_TOP_N):
+    """Profiles the enclosed run, doing nothing when no output prefix is given.
+
+    The sample mode writes collapsed stacks and a top-N report; the cprofile
+    mode writes a pstats file and a top-N report by cumulative time. Both
+    write the wall time spent in each stage.
+    """
+    if output_prefix is None:
+        yield
+        return
+    if mode not in ("sample", "cprofile"):
+        raise ValueError(f"Unknown profile mode {mode}")
+
+    with _stage_times_lock:
+        stage_times.clear()
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+
+    try:
+        yield
+    finally:
+        os.makedirs(os.path.dirname(output_prefix) or ".", exist_ok=True)
+        if mode == "cprofile":
+            profiler.disable()
+            profiler.dump_stats(f"{output_prefix}.pstats")
+            with open(f"{output_prefix}.top.txt", "w", encoding="utf-8") as f:
+                pstats.Stats(profiler, stream=f).sort_stats(
+                    "cumulative").print_stats(top_n)
+        else:
+            profiler.stop()
+            profiler.write(output_prefix, top_n)
+        with open(f"{output_prefix}.stages.txt", "w", encoding="utf-8") as f:
+            f.write(format_stage_times())
+
+
+def capture_sample(output_dir: str, duration: float,
+                   interval: float = DEFAULT_INTERVAL) -> str:
+    """Samples the running process for a while and writes a timestamped profile."""
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    time.sleep(duration)
+    profiler.stop()
+    # Microseconds and the thread id keep overlapping captures from sharing a name
+    name = f"profile_{datetime.now().strftime('%Y%m%dT%H%M%S_%f')}_{threading.get_ident()}"
+    output_prefix = os.path.join(output_dir, name)
+    profiler.write(output_prefix)
+    return output_prefix
+
+
+def start_periodic_sampling(output_dir: str, every: float, duration: float,
+                            interval: float = DEFAULT_INTERVAL) -> threading.Event:
+    """Captures a short sample every so often until the returned event is set.
+
+    Sampling only runs for duration out of every seconds, keeping the
+    overhead low enough for a production consumer.
+    """
+    stopped = threading.Event()
+
+    def run() -> None:
+        while not stopped.wait(every):
+            capture_sample(output_dir, duration, interval)
+
+    threading.Thread(target=run, name="periodic-profiler", daemon=True).start()
+    logging.info("Sampling for %ss every %ss into %s", duration, every, output_dir)
+    return stopped
+
+
+def install_signal_trigger(output_dir: str, duration: float,
+                           interval: float = DEFAULT_INTERVAL) -> bool:
+    """Captures a sample on SIGUSR1, so a running process can be profiled on demand."""
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+
+    def handler(signum, frame):
+        threading.Thread(target=capture_sample, args=(output_dir, duration, interval),
+                         name="on-demand-profiler", daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, handler)
+    logging.info("Send SIGUSR1 to pid %s to capture a %ss profile", os.getpid(), duration)
+    return True
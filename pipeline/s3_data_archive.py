@@ -0,0 +1,197 @@
+"""Module containing functions to archive processed data, rejects and run manifests to an s3 bucket"""
+import os
+import json
+import zlib
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+ARCHIVE_PREFIX = "archive"
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+
+def archive_key(kind: str, name: str, run_date: datetime, compression: str = "gzip") -> str:
+    """Builds a date-partitioned key for an archived file."""
+    return (f"{ARCHIVE_PREFIX}/{kind}/year={run_date.year}/month={run_date.month:02d}/"
+            f"day={run_date.day:02d}/{name}{EXTENSIONS[compression]}")
+
+
+def get_compressor(compression: str):
+    """Returns a streaming compressor with compress and flush methods."""
+    if compression == "gzip":
+        return zlib.compressobj(wbits=31)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor().compressobj()
+    if compression == "none":
+        return None
+    raise ValueError(f"Unknown compression {compression}")
+
+
+def compressed_chunks(chunks, compression: str):
+    """Compresses an iterable of byte chunks as a stream."""
+    compressor = get_compressor(compression)
+    for chunk in chunks:
+        data = compressor.compress(chunk) if compressor else chunk
+        if data:
+            yield data
+    if compressor:
+        tail = compressor.flush()
+        if tail:
+            yield tail
+
+
+def read_chunks(file_path: str, chunk_size: int = READ_CHUNK_SIZE):
+    """Reads a local file in fixed-size chunks."""
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def upload_part(s3_client, bucket_name: str, key: str, upload_id: str,
+                part_number: int, body: bytes) -> dict:
+    """Uploads a single part of a multipart upload."""
+    response = s3_client.upload_part(Bucket=bucket_name, Key=key, UploadId=upload_id,
+                                     PartNumber=part_number, Body=body)
+    logging.info("Uploaded part %s of %s (%s bytes)", part_number, key, len(body))
+    return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+
+def upload_stream(s3_client, bucket_name: str, key: str, chunks,
+                  part_size: int = DEFAULT_PART_SIZE, max_workers: int = 4,
+                  max_buffered_parts: int = 4) -> str:
+    """Uploads a stream of bytes, using parallel multipart uploads for large streams.
+
+    At most max_buffered_parts parts wait on or are being uploaded at once,
+    so memory use stays around part_size * (max_buffered_parts + 1).
+    """
+    if part_size < MIN_PART_SIZE:
+        raise ValueError(f"Part size must be at least {MIN_PART_SIZE} bytes")
+
+    buffer = bytearray()
+    stream = iter(chunks)
+    for chunk in stream:
+        buffer.extend(chunk)
+        if len(buffer) >= part_size:
+            break
+    else:
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=bytes(buffer))
+        logging.info("Uploaded %s (%s bytes)", key, len(buffer))
+        return key
+
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket_name, Key=key)["UploadId"]
+    slots = threading.BoundedSemaphore(max_buffered_parts)
+    futures = []
+
+    def submit(part_number: int, body: bytes) -> None:
+        slots.acquire()
+        future = pool.submit(upload_part, s3_client, bucket_name, key,
+                             upload_id, part_number, body)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            part_number = 1
+            for chunk in stream:
+                buffer.extend(chunk)
+                while len(buffer) >= part_size:
+                    submit(part_number, bytes(buffer[:part_size]))
+                    del buffer[:part_size]
+                    part_number += 1
+            while len(buffer) >= part_size:
+                submit(part_number, bytes(buffer[:part_size]))
+                del buffer[:part_size]
+                part_number += 1
+            if buffer:
+                submit(part_number, bytes(buffer))
+            parts = [future.result() for future in futures]
+
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id,
+            MultipartUpload={"Parts": parts})
+    except Exception as e:
+        logging.error("Failed to upload %s: %s", key, e)
+        s3_client.abort_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id)
+        raise
+
+    logging.info("Uploaded %s in %s parts", key, len(parts))
+    return key
+
+
+def archive_file(s3_client, bucket_name: str, file_path: str, kind: str,
+                 run_date: datetime = None, compression: str = "gzip",
+                 delete_after: bool = True, **upload_options) -> str:
+    """Compresses and uploads a local file, then removes it from local disk."""
+    run_date = run_date or datetime.now()
+    key = archive_key(kind, os.path.basename(file_path), run_date, compression)
+    upload_stream(s3_client, bucket_name, key,
+                  compressed_chunks(read_chunks(file_path), compression),
+                  **upload_options)
+    if delete_after:
+        os.remove(file_path)
+        logging.info("Removed local copy of %s", file_path)
+    return key
+
+
+class RejectWriter:
+    """Appends rejected records to a local JSON lines file, created on the first reject."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.file = None
+        self.count = 0
+
+    def write(self, reason: str, data, source: str = None) -> None:
+        """Records a rejected record with the reason it was rejected."""
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            self.file = open(self.file_path, "a", encoding="utf-8")
+        self.file.write(json.dumps({"rejected_at": datetime.now(), "reason": reason,
+                                    "source": source, "data": data}, default=str) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        """Closes the rejects file."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def archive_rejects(s3_client, bucket_name: str, rejects: RejectWriter,
+                    run_date: datetime = None, compression: str = "gzip") -> str | None:
+    """Archives a rejects file under rejected, if anything was rejected."""
+    rejects.close()
+    if not rejects.count:
+        return None
+    key = archive_file(s3_client, bucket_name, rejects.file_path, "rejected",
+                       run_date, compression)
+    logging.info("Archived %s rejected records to %s", rejects.count, key)
+    return key
+
+
+def archive_manifest(s3_client, bucket_name: str, manifest: dict,
+                     run_date: datetime = None, compression: str = "gzip") -> str:
+    """Uploads a run manifest as compressed JSON."""
+    run_date = run_date or datetime.now()
+    name = f"manifest_{run_date.strftime('%Y%m%dT%H%M%S')}.json"
+    key = archive_key("manifests", name, run_date, compression)
+    body = json.dumps(manifest, default=str).encode("utf-8")
+    return upload_stream(s3_client, bucket_name, key,
+                         compressed_chunks([body], compression))
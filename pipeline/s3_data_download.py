@@ -1,10 +1,14 @@
 """Module containing functions to extract files from an s3 bucket"""
 import os
 import csv
+import argparse
 import boto3
 from dotenv import load_dotenv
 
 
+KIOSK_PREFIX = "lmnh_hist_data_"
+
+
 def download_files(bucket, file_type, substring, name):
     """Download files from the bucket that match the given type and substring."""
     counter = 1
@@ -51,10 +55,22 @@ def delete_file(file_name):
         return f"File not found, skipping {file_name}"
 
 
+def list_kiosk_keys(bucket):
+    """List the keys of the kiosk files in the bucket, in order."""
+    return sorted(file.key for file in bucket.objects.filter(Prefix=KIOSK_PREFIX)
+                  if file.key.endswith("csv"))
+
+
+def download_kiosk_file(bucket, key):
+    """Download a single kiosk file, keeping its name."""
+    output_file = f"../data/{os.path.basename(key)}"
+    bucket.download_file(key, output_file)
+    return output_file
+
+
 def get_kiosk_files(bucket):
     """Download and combine kiosk files."""
-    substring_kiosk = "lmnh_hist_data_"
-    file_names = download_files(bucket, 'csv', substring_kiosk, "kiosk")
+    file_names = download_files(bucket, 'csv', KIOSK_PREFIX, "kiosk")
     combined_file = combine_csv_files(file_names, "../data/kiosk_data.csv")
     return combined_file, file_names
 
@@ -95,5 +111,14 @@ def get_files(bucket_name):
     return kiosk_data, exhibit_data
 
 
+def main(argv: list[str] = None):
+    """Downloads the kiosk and exhibit files from the given bucket."""
+    parser = argparse.ArgumentParser(description="Download kiosk data from S3.")
+    parser.add_argument("-b", "--bucket", default="sigma-resources-museum",
+                        help="Name of the AWS bucket")
+    args = parser.parse_args(argv)
+    get_files(args.bucket)
+
+
 if __name__ == "__main__":
-    get_files('sigma-resources-museum')
+    main()
@@ -0,0 +1,82 @@
+"""Benchmarks the startup time and peak memory of each pipeline subcommand."""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from time import perf_counter
+
+
+# Run in a fresh interpreter so every measurement starts with an empty module cache
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+if sys.argv[1]:
+    import cli
+    cli.load_command(sys.argv[1])
+import_time = time.perf_counter() - started
+heavy = [name for name in ("boto3", "psycopg2", "confluent_kafka") if name in sys.modules]
+print(json.dumps({"import_time": import_time,
+                  "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  "heavy_modules": heavy}))
+"""
+
+
+def measure_command(command: str, repeat: int = 5) -> dict:
+    """Measures a subcommand's startup in fresh interpreters, returning medians."""
+    wall_times = []
+    import_times = []
+    max_rss = []
+    heavy_modules = []
+    for _ in range(repeat):
+        started = perf_counter()
+        result = subprocess.run([sys.executable, "-c", PROBE, command],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        wall_times.append(perf_counter() - started)
+        probe = json.loads(result.stdout)
+        import_times.append(probe["import_time"])
+        max_rss.append(probe["max_rss_kb"])
+        heavy_modules = probe["heavy_modules"]
+
+    return {
+        "command": command or "(interpreter)",
+        "wall_ms": statistics.median(wall_times) * 1000,
+        "import_ms": statistics.median(import_times) * 1000,
+        "max_rss_mb": statistics.median(max_rss) / 1024,
+        "heavy_modules": heavy_modules,
+    }
+
+
+def format_results(results: list[dict]) -> str:
+    """Formats benchmark results as a table."""
+    lines = [f"{'command':<15}{'wall ms':>10}{'import ms':>12}{'rss MB':>10}  heavy imports"]
+    for result in results:
+        lines.append(f"{result['command']:<15}{result['wall_ms']:>10.1f}"
+                     f"{result['import_ms']:>12.1f}{result['max_rss_mb']:>10.1f}  "
+                     f"{', '.join(result['heavy_modules']) or '-'}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] = None):
+    """Benchmarks each subcommand against a bare interpreter."""
+    from cli import COMMANDS
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark startup time and memory of the pipeline subcommands.")
+    parser.add_argument("commands", nargs="*", default=list(COMMANDS),
+                        help="Subcommands to benchmark")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs per subcommand, the median is reported")
+    args = parser.parse_args(argv)
+
+    results = [measure_command("", args.repeat)]
+    results.extend(measure_command(command, args.repeat)
+                   for command in args.commands)
+    print(format_results(results))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# pylint: skip-file
+import logging
+import pytest
+
+from batch_loader import AdaptiveBatchController, BatchWriter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SimulatedSink:
+    """Sink that advances a fake clock by a configurable per-batch latency."""
+
+    def __init__(self, clock, latency, fail_above=None):
+        self.clock = clock
+        self.latency = latency
+        self.fail_above = fail_above
+        self.batches = []
+
+    def __call__(self, batch):
+        self.clock.now += self.latency(len(batch))
+        if self.fail_above is not None and len(batch) > self.fail_above:
+            raise Exception("Database error")
+        self.batches.append(list(batch))
+
+
+def test_controller_increases_additively_under_target():
+    controller = AdaptiveBatchController(target_latency=0.5, initial_size=50,
+                                         increase_step=10)
+
+    controller.record(50, 0.1)
+    controller.record(60, 0.1)
+
+    assert controller.batch_size == 70
+    assert controller.metrics()["increases"] == 2
+
+
+def test_controller_decreases_multiplicatively_over_target():
+    controller = AdaptiveBatchController(target_latency=0.5, initial_size=100,
+                                         initial_interval=1.0)
+
+    controller.record(100, 0.9)
+
+    assert controller.batch_size == 50
+    assert controller.flush_interval == 2.0
+
+
+def test_controller_decreases_on_error_and_respects_bounds():
+    controller = AdaptiveBatchController(initial_size=2, min_size=1,
+                                         initial_interval=8.0, max_interval=10.0)
+
+    controller.record(2, 0.01, error=True)
+    controller.record(1, 0.01, error=True)
+
+    metrics = controller.metrics()
+    assert metrics["batch_size"] == 1
+    assert metrics["flush_interval"] == 10.0
+    assert metrics["errors"] == 2
+    assert metrics["error_rate"] > 0
+
+
+def test_controller_logs_metrics_every_n_batches(caplog):
+    controller = AdaptiveBatchController(log_every=2)
+
+    with caplog.at_level(logging.INFO):
+        controller.record(10, 0.1)
+        controller.record(10, 0.1)
+        controller.record(10, 0.1)
+
+    info = [r for r in caplog.records if r.levelno == logging.INFO]
+    assert len(info) == 1
+    assert "'batches': 2" in info[0].getMessage()
+
+
+def test_writer_converges_to_latency_budget():
+    clock = FakeClock()
+    sink = SimulatedSink(clock, latency=lambda size: 0.05 + size * 0.001)
+    controller = AdaptiveBatchController(target_latency=0.5, initial_size=10,
+                                         increase_step=50)
+    writer = BatchWriter(sink, controller, clock=clock)
+
+    for entry in range(20000):
+        writer.add(entry)
+    writer.flush()
+
+    assert sum(len(batch) for batch in sink.batches) == 20000
+    assert [e for batch in sink.batches for e in batch] == list(range(20000))
+    # 0.05 + 0.001 * size crosses the 0.5s budget at 450 rows, so the size
+    # saws between roughly half that and one step above it
+    assert 200 <= controller.batch_size <= 450 + 2 * 50
+    assert controller.latency_avg < 0.6
+
+
+def test_writer_retries_failed_batch_with_smaller_size():
+    clock = FakeClock()
+    sink = SimulatedSink(clock, latency=lambda size: 0.01, fail_above=20)
+    controller = AdaptiveBatchController(initial_size=80, increase_step=0)
+    writer = BatchWriter(sink, controller, clock=clock)
+
+    for entry in range(79):
+        writer.add(entry)
+    writer.flush()
+
+    assert [e for batch in sink.batches for e in batch] == list(range(79))
+    assert controller.errors == 2
+    assert controller.batch_size == 20
+
+
+def test_writer_raises_after_max_retries():
+    clock = FakeClock()
+    sink = SimulatedSink(clock, latency=lambda size: 0.01, fail_above=0)
+    writer = BatchWriter(sink, AdaptiveBatchController(initial_size=4),
+                         max_retries=2, clock=clock)
+
+    for entry in range(3):
+        writer.add(entry)
+
+    with pytest.raises(Exception):
+        writer.flush()
+    assert writer.buffer == [0, 1, 2]
+
+
+def test_writer_flushes_partial_batch_after_interval():
+    clock = FakeClock()
+    sink = SimulatedSink(clock, latency=lambda size: 0.01)
+    controller = AdaptiveBatchController(initial_size=100, initial_interval=1.0)
+    writer = BatchWriter(sink, controller, clock=clock)
+
+    writer.add("a")
+    writer.maybe_flush()
+    assert sink.batches == []
+
+    clock.now += 1.5
+    writer.maybe_flush()
+    assert sink.batches == [["a"]]
+
+
+def test_writer_reports_positions_of_flushed_entries():
+    clock = FakeClock()
+    sink = SimulatedSink(clock, latency=lambda size: 0.01)
+    flushed = []
+    writer = BatchWriter(sink, AdaptiveBatchController(initial_size=2), clock=clock,
+                         on_flush=flushed.append)
+
+    for offset in range(3):
+        writer.add(f"entry{offset}", ("lmnh", 0, offset))
+    assert flushed == [[("lmnh", 0, 0), ("lmnh", 0, 1)]]
+
+    writer.flush()
+    assert flushed[-1] == [("lmnh", 0, 2)]
+    assert writer.positions == []
+
+
+def test_writer_does_not_report_failed_batches():
+    clock = FakeClock()
+    sink = SimulatedSink(clock, latency=lambda size: 0.01, fail_above=0)
+    flushed = []
+    writer = BatchWriter(sink, AdaptiveBatchController(initial_size=1),
+                         max_retries=0, clock=clock, on_flush=flushed.append)
+
+    with pytest.raises(Exception):
+        writer.add("a", ("lmnh", 0, 5))
+    assert flushed == []
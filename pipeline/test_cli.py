@@ -0,0 +1,33 @@
+# pylint: skip-file
+from unittest.mock import patch, MagicMock
+import pytest
+
+from cli import main, load_command, COMMANDS
+
+
+@patch("cli.importlib.import_module")
+def test_main_forwards_arguments_to_subcommand(mock_import_module):
+    module = MagicMock()
+    mock_import_module.return_value = module
+
+    main(["backfill", "--bucket", "museum", "--resume"])
+
+    mock_import_module.assert_called_once_with("etl_pipeline")
+    module.main.assert_called_once_with(["--bucket", "museum", "--resume"])
+
+
+@patch("cli.importlib.import_module")
+def test_load_command_imports_only_requested_module(mock_import_module):
+    load_command("consume")
+
+    mock_import_module.assert_called_once_with("kafka_data_process")
+
+
+def test_main_rejects_unknown_subcommand():
+    with pytest.raises(SystemExit):
+        main(["serve"])
+
+
+def test_every_subcommand_has_a_main():
+    for name in COMMANDS:
+        assert callable(load_command(name))
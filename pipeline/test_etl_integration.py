@@ -0,0 +1,150 @@
+# pylint: skip-file
+from unittest.mock import patch
+import psycopg2.extras
+import pytest
+
+from pg_harness import connect
+from load_bench import make_entries
+from batch_loader import AdaptiveBatchController
+from etl_pipeline import (import_single_kiosk_data, import_rating_interactions,
+                          import_kiosk_batch, import_kiosk_data, get_checkpoints,
+                          complete_checkpoint, parse_arguments, run_pipeline)
+
+
+def count_rows(cursor, table):
+    cursor.execute(f"SELECT COUNT(*) AS total FROM {table}")
+    return cursor.fetchone()["total"]
+
+
+def get_dict_cursor(conn):
+    return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+
+def get_row_offset(cursor, source_file):
+    checkpoint = get_checkpoints(cursor).get(source_file)
+    return checkpoint["row_offset"] if checkpoint else None
+
+
+def test_import_single_kiosk_data(pg_conn):
+    cursor = get_dict_cursor(pg_conn)
+
+    import_single_kiosk_data({"at": "2024-10-22 10:00:00", "val": "3", "site": "1"},
+                             pg_conn, cursor)
+    import_single_kiosk_data({"at": "2024-10-22 11:00:00", "val": "-1", "type": "1",
+                              "site": "4"}, pg_conn, cursor)
+
+    cursor.execute("""SELECT exhibition_id, rating_value FROM rating_interaction
+                   JOIN rating USING (rating_id)""")
+    assert cursor.fetchall() == [{"exhibition_id": 2, "rating_value": 3}]
+    cursor.execute("""SELECT exhibition_id, request_description FROM request_interaction
+                   JOIN request USING (request_id)""")
+    assert cursor.fetchall() == [{"exhibition_id": 5, "request_description": "emergency"}]
+
+
+def test_import_kiosk_batch_with_checkpoint(pg_conn):
+    cursor = get_dict_cursor(pg_conn)
+    entries = make_entries(60)
+
+    import_kiosk_batch(entries, pg_conn, cursor, ("kiosk_data.csv", 60))
+    import_kiosk_batch(entries[:6], pg_conn, cursor, ("kiosk_data.csv", 66))
+
+    assert count_rows(cursor, "request_interaction") == 11
+    assert count_rows(cursor, "rating_interaction") == 55
+    assert get_row_offset(cursor, "kiosk_data.csv") == 66
+
+
+def test_import_kiosk_batch_fails_on_unknown_lookup_values(pg_conn):
+    cursor = get_dict_cursor(pg_conn)
+    entries = [{"at": "2024-10-22 10:00:00", "val": "3", "site": "1"},
+               {"at": "2024-10-22 10:01:00", "val": "9", "site": "1"},
+               {"at": "2024-10-22 10:02:00", "val": "-1", "type": "7", "site": "1"}]
+
+    with pytest.raises(ValueError):
+        import_kiosk_batch(entries, pg_conn, cursor, ("kiosk_data.csv", 3))
+    with pytest.raises(ValueError):
+        import_kiosk_batch(entries[2:], pg_conn, cursor, ("kiosk_data.csv", 3))
+
+    assert count_rows(cursor, "rating_interaction") == 0
+    assert count_rows(cursor, "request_interaction") == 0
+    assert get_row_offset(cursor, "kiosk_data.csv") is None
+
+
+def test_checkpoints_are_kept_per_source_file(pg_conn):
+    cursor = get_dict_cursor(pg_conn)
+
+    import_kiosk_data(make_entries(30), pg_conn, cursor,
+                      controller=AdaptiveBatchController(initial_size=10),
+                      source_file="lmnh_hist_data_0.csv")
+    complete_checkpoint("lmnh_hist_data_0.csv", 30, pg_conn, cursor)
+    import_kiosk_batch(make_entries(5), pg_conn, cursor, ("lmnh_hist_data_1.csv", 5))
+
+    assert get_checkpoints(cursor) == {
+        "lmnh_hist_data_0.csv": {"row_offset": 30, "completed": True},
+        "lmnh_hist_data_1.csv": {"row_offset": 5, "completed": False}}
+
+
+def test_batched_load_matches_row_by_row(pg_conn):
+    cursor = get_dict_cursor(pg_conn)
+    entries = make_entries(500)
+
+    import_kiosk_data(entries, pg_conn, cursor)
+    row_by_row = (count_rows(cursor, "request_interaction"),
+                  count_rows(cursor, "rating_interaction"))
+    cursor.execute("TRUNCATE request_interaction, rating_interaction")
+
+    import_kiosk_data(entries, pg_conn, cursor,
+                      controller=AdaptiveBatchController(initial_size=50))
+
+    assert (count_rows(cursor, "request_interaction"),
+            count_rows(cursor, "rating_interaction")) == row_by_row
+
+
+def test_failed_insert_rolls_back_only_its_own_row(pg_conn):
+    cursor = get_dict_cursor(pg_conn)
+    import_single_kiosk_data({"at": "2024-10-22 10:00:00", "val": "3", "site": "1"},
+                             pg_conn, cursor)
+
+    with pytest.raises(Exception):
+        import_rating_interactions("2024-10-22 10:01:00", 2, 999, pg_conn, cursor)
+
+    assert count_rows(cursor, "rating_interaction") == 1
+
+
+def test_batched_load_commits_checkpoint(pg_fresh_database):
+    conn = connect(pg_fresh_database)
+    cursor = get_dict_cursor(conn)
+
+    import_kiosk_data(make_entries(5000), conn, cursor,
+                      controller=AdaptiveBatchController(initial_size=100, increase_step=100),
+                      source_file="kiosk_data.csv")
+
+    assert get_row_offset(cursor, "kiosk_data.csv") == 5000
+    assert count_rows(cursor, "request_interaction") + \
+        count_rows(cursor, "rating_interaction") == 5000
+    conn.close()
+
+
+def test_resumed_run_stops_at_bad_row(pg_fresh_database, tmp_path):
+    source_file = "lmnh_hist_data_0.csv"
+    rows = [f"2024-10-22 10:0{i}:00,1,{9 if i == 6 else 3}," for i in range(10)]
+    (tmp_path / source_file).write_text("\n".join(["at,site,val,type"] + rows) + "\n",
+                                        encoding="utf-8")
+    conn = connect(pg_fresh_database)
+    cursor = get_dict_cursor(conn)
+    import_kiosk_batch([{"at": "2024-10-22 10:00:00", "site": "1", "val": "3"}] * 2,
+                       conn, cursor, (source_file, 2))
+
+    with patch("s3_data_download.setup_aws_session"), \
+            patch("s3_data_download.list_kiosk_keys", return_value=[source_file]), \
+            patch("s3_data_download.download_kiosk_file",
+                  side_effect=lambda bucket, key: str(tmp_path / key)), \
+            patch("s3_data_download.get_exhibit_files"), \
+            patch("etl_pipeline.get_connection", side_effect=lambda: connect(pg_fresh_database)):
+        with pytest.raises(ValueError):
+            run_pipeline(parse_arguments(["-b", "museum", "--resume"]))
+
+    checkpoint = get_checkpoints(cursor)[source_file]
+    assert not checkpoint["completed"]
+    assert 2 <= checkpoint["row_offset"] <= 6
+    assert count_rows(cursor, "rating_interaction") == checkpoint["row_offset"]
+    conn.close()
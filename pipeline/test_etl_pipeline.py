@@ -1,9 +1,14 @@
 # pylint: skip-file
+import gzip
+import json
+import boto3
 import pytest
+from moto import mock_aws
 import psycopg2
 from unittest.mock import patch, MagicMock, mock_open
 
-from etl_pipeline import load_csv, get_connection, get_cursor, import_request_interactions, import_rating_interactions, import_kiosk_data
+from etl_pipeline import load_csv, get_connection, get_cursor, import_request_interactions, import_rating_interactions, import_kiosk_data, split_kiosk_entries, import_kiosk_batch, get_checkpoints, parse_arguments, run_pipeline
+from batch_loader import AdaptiveBatchController
 
 
 def test_load_csv():
@@ -113,6 +118,7 @@ def test_import_request_interactions_error(mock_connect):
     with pytest.raises(Exception):
         import_request_interactions(
             event_at, request_id, exhibit_id, mock_conn, mock_cursor)
+    mock_conn.rollback.assert_called_once()
 
 
 @patch('psycopg2.connect')
@@ -131,6 +137,7 @@ def test_import_rating_interactions_error(mock_connect):
     with pytest.raises(Exception):
         import_rating_interactions(
             event_at, rating_id, exhibit_id, mock_conn, mock_cursor)
+    mock_conn.rollback.assert_called_once()
 
 
 @patch('psycopg2.connect')
@@ -157,3 +164,312 @@ def test_import_kiosk_data(mock_load_csv, mock_connect):
 
         assert mock_cursor.fetchone.call_count == 2
         assert mock_conn.commit.call_count == 4
+
+
+def test_split_kiosk_entries():
+    entries = [
+        {"at": "2024-01-01 10:00:00", "val": "-1", "type": "1.0", "site": "2"},
+        {"at": "2024-01-01 11:00:00", "val": "3", "type": "", "site": "0"}
+    ]
+
+    request_rows, rating_rows = split_kiosk_entries(entries)
+
+    assert request_rows == [(3, 1, "2024-01-01 10:00:00")]
+    assert rating_rows == [(1, 3, "2024-01-01 11:00:00")]
+
+
+def test_split_kiosk_entries_collects_malformed_entries():
+    entries = [{"at": "2024-01-01 10:00:00", "val": "abc", "site": "2"},
+               {"at": "2024-01-01 10:01:00", "val": "-1", "site": "2"},
+               {"at": "2024-01-01 11:00:00", "val": "3", "site": "0"}]
+    rejected = []
+
+    request_rows, rating_rows = split_kiosk_entries(entries, rejected)
+
+    assert request_rows == []
+    assert rating_rows == [(1, 3, "2024-01-01 11:00:00")]
+    assert [entry for entry, _ in rejected] == entries[:2]
+    assert rejected[1][1] == "KeyError: 'type'"
+    with pytest.raises(ValueError):
+        split_kiosk_entries(entries)
+
+
+@patch('etl_pipeline.psycopg2.extras.execute_values')
+def test_import_kiosk_batch_writes_rejects_after_commit(mock_execute_values):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_cursor.rowcount = 1
+    rejects = MagicMock()
+    mock_conn.commit.side_effect = lambda: rejects.write.assert_not_called()
+    entries = [{"at": "2024-01-01 11:00:00", "val": "4", "site": "5"},
+               {"at": "2024-01-01 11:01:00", "val": "", "site": "5"}]
+
+    import_kiosk_batch(entries, mock_conn, mock_cursor, ("kiosk_data.csv", 2), rejects)
+
+    rejects.write.assert_called_once_with(
+        "ValueError: invalid literal for int() with base 10: ''", entries[1], "kiosk_data.csv")
+
+
+@patch('etl_pipeline.psycopg2.extras.execute_values')
+def test_import_kiosk_batch(mock_execute_values):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    entries = [
+        {"at": "2024-01-01 10:00:00", "val": "-1", "type": "0", "site": "1"},
+        {"at": "2024-01-01 11:00:00", "val": "4", "site": "5"}
+    ]
+    mock_cursor.rowcount = 1
+
+    import_kiosk_batch(entries, mock_conn, mock_cursor)
+
+    assert mock_execute_values.call_count == 2
+    assert mock_execute_values.call_args_list[0].args[2] == [
+        (2, 0, "2024-01-01 10:00:00")]
+    assert mock_execute_values.call_args_list[1].args[2] == [
+        (6, 4, "2024-01-01 11:00:00")]
+    mock_conn.commit.assert_called_once()
+
+
+@patch('etl_pipeline.psycopg2.extras.execute_values')
+def test_import_kiosk_batch_error(mock_execute_values):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_execute_values.side_effect = Exception("Database error")
+
+    with pytest.raises(Exception):
+        import_kiosk_batch([{"at": "2024-01-01 11:00:00", "val": "4", "site": "5"}],
+                           mock_conn, mock_cursor)
+
+    mock_conn.rollback.assert_called_once()
+    mock_conn.commit.assert_not_called()
+
+
+@patch('etl_pipeline.psycopg2.extras.execute_values')
+def test_import_kiosk_batch_rejects_unmatched_rows(mock_execute_values):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_cursor.rowcount = 1
+    entries = [{"at": "2024-01-01 11:00:00", "val": "4", "site": "5"},
+               {"at": "2024-01-01 11:01:00", "val": "9", "site": "5"}]
+
+    with pytest.raises(ValueError):
+        import_kiosk_batch(entries, mock_conn, mock_cursor, ("kiosk_data.csv", 2))
+
+    mock_conn.rollback.assert_called_once()
+    mock_conn.commit.assert_not_called()
+
+
+@patch('etl_pipeline.import_kiosk_batch')
+def test_import_kiosk_data_batched(mock_import_batch):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    entries = [{"at": "2024-01-01 11:00:00", "val": "4", "site": "5"}] * 25
+    controller = AdaptiveBatchController(initial_size=10, increase_step=0)
+
+    import_kiosk_data(entries, mock_conn, mock_cursor, controller=controller)
+
+    assert [len(call.args[0]) for call in mock_import_batch.call_args_list] == [10, 10, 5]
+    assert controller.metrics()["rows"] == 25
+
+
+def test_load_csv_skips_checkpointed_rows():
+    mock_csv_data = "column1\nvalue1\nvalue2\nvalue3\n"
+
+    with patch("builtins.open", mock_open(read_data=mock_csv_data)):
+        result = load_csv("fake_path.csv", skip=2)
+
+    assert result == [{"column1": "value3"}]
+
+
+@patch('etl_pipeline.psycopg2.extras.execute_values')
+def test_import_kiosk_batch_saves_checkpoint_before_commit(mock_execute_values):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    calls = MagicMock()
+    mock_cursor.execute.side_effect = lambda *args: calls.checkpoint(*args)
+    mock_conn.commit.side_effect = calls.commit
+    mock_cursor.rowcount = 1
+
+    import_kiosk_batch([{"at": "2024-01-01 11:00:00", "val": "4", "site": "5"}],
+                       mock_conn, mock_cursor, ("kiosk_data.csv", 500))
+
+    assert [call[0] for call in calls.mock_calls] == ["checkpoint", "commit"]
+    assert calls.checkpoint.call_args.args[1] == ("kiosk_data.csv", 500, False)
+
+
+@patch('etl_pipeline.import_kiosk_batch')
+def test_import_kiosk_data_checkpoints_from_start_offset(mock_import_batch):
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    entries = [{"at": "2024-01-01 11:00:00", "val": "4", "site": "5"}] * 25
+    controller = AdaptiveBatchController(initial_size=10, increase_step=0)
+
+    import_kiosk_data(entries, mock_conn, mock_cursor, controller=controller,
+                      source_file="kiosk_data.csv", start_offset=100)
+
+    assert [call.args[3] for call in mock_import_batch.call_args_list] == [
+        ("kiosk_data.csv", 110), ("kiosk_data.csv", 120), ("kiosk_data.csv", 125)]
+
+
+KIOSK_KEYS = ["lmnh_hist_data_0.csv", "lmnh_hist_data_1.csv", "lmnh_hist_data_2.csv"]
+ENTRY = {"at": "2024-01-01 11:00:00", "val": "4", "site": "5"}
+
+
+@pytest.fixture
+def pipeline():
+    with patch("s3_data_download.setup_aws_session") as mock_session, \
+            patch("s3_data_download.list_kiosk_keys", return_value=KIOSK_KEYS), \
+            patch("s3_data_download.download_kiosk_file",
+                  side_effect=lambda bucket, key: f"../data/{key}") as mock_download, \
+            patch("s3_data_download.get_exhibit_files"), \
+            patch("etl_pipeline.get_connection"), patch("etl_pipeline.get_cursor"), \
+            patch("etl_pipeline.get_checkpoints", return_value={}) as mock_checkpoints, \
+            patch("etl_pipeline.reset_database") as mock_reset, \
+            patch("etl_pipeline.load_csv", return_value=[ENTRY] * 3) as mock_load_csv, \
+            patch("etl_pipeline.import_kiosk_data") as mock_import, \
+            patch("etl_pipeline.complete_checkpoint") as mock_complete, \
+            patch("etl_pipeline.archive_file",
+                  side_effect=lambda client, bucket, path, *args: f"archive/{path}.gz"), \
+            patch("etl_pipeline.archive_manifest") as mock_manifest, \
+            patch("etl_pipeline.os.remove") as mock_remove:
+        yield MagicMock(download=mock_download, checkpoints=mock_checkpoints,
+                        reset=mock_reset, load_csv=mock_load_csv, import_data=mock_import,
+                        complete=mock_complete, manifest=mock_manifest, remove=mock_remove,
+                        s3_client=mock_session.return_value.client.return_value)
+
+
+def test_run_pipeline_checkpoints_each_source_file(pipeline):
+    run_pipeline(parse_arguments(["-b", "bucket"]))
+
+    pipeline.reset.assert_called_once()
+    assert [call.args[5:7] for call in pipeline.import_data.call_args_list] == [
+        (key, 0) for key in KIOSK_KEYS]
+    assert [call.args[:2] for call in pipeline.complete.call_args_list] == [
+        (key, 3) for key in KIOSK_KEYS]
+    pipeline.remove.assert_not_called()
+
+
+def test_run_pipeline_resume_skips_completed_and_seeks_partial_files(pipeline):
+    pipeline.checkpoints.return_value = {
+        "lmnh_hist_data_0.csv": {"row_offset": 3, "completed": True},
+        "lmnh_hist_data_1.csv": {"row_offset": 2, "completed": False}}
+
+    run_pipeline(parse_arguments(["-b", "bucket", "--resume"]))
+
+    pipeline.reset.assert_not_called()
+    assert [call.args[1] for call in pipeline.download.call_args_list] == KIOSK_KEYS[1:]
+    assert pipeline.load_csv.call_args_list[0].args == ("../data/lmnh_hist_data_1.csv", 2)
+    assert [call.args[:2] for call in pipeline.complete.call_args_list] == [
+        ("lmnh_hist_data_1.csv", 5), ("lmnh_hist_data_2.csv", 3)]
+
+
+def test_run_pipeline_limit_leaves_file_incomplete(pipeline):
+    run_pipeline(parse_arguments(["-b", "bucket", "--limit", "5"]))
+
+    assert [call.args[3] for call in pipeline.import_data.call_args_list] == [5, 2]
+    assert [call.args[0] for call in pipeline.complete.call_args_list] == [KIOSK_KEYS[0]]
+
+
+def test_run_pipeline_resume_refuses_without_checkpoints(pipeline):
+    with pytest.raises(ValueError):
+        run_pipeline(parse_arguments(["-b", "bucket", "--resume"]))
+
+    pipeline.reset.assert_not_called()
+    pipeline.import_data.assert_not_called()
+
+
+def test_run_pipeline_resume_can_start_over(pipeline):
+    run_pipeline(parse_arguments(["-b", "bucket", "--resume", "--allow-restart"]))
+
+    pipeline.reset.assert_called_once()
+    assert pipeline.import_data.call_count == 3
+
+
+def test_run_pipeline_archives_after_successful_load(pipeline):
+    run_pipeline(parse_arguments(["-b", "bucket", "--archive-bucket", "archive"]))
+
+    manifest = pipeline.manifest.call_args.args[2]
+    assert manifest["status"] == "succeeded"
+    assert manifest["archived"] == [f"archive/../data/{key}.gz" for key in KIOSK_KEYS]
+    assert pipeline.remove.call_count == 3
+    pipeline.s3_client.delete_object.assert_not_called()
+
+
+def test_run_pipeline_keeps_input_and_records_failed_load(pipeline):
+    pipeline.import_data.side_effect = Exception("Database error")
+
+    with pytest.raises(Exception):
+        run_pipeline(parse_arguments(["-b", "bucket", "--archive-bucket", "archive"]))
+
+    manifest = pipeline.manifest.call_args.args[2]
+    assert manifest["status"] == "failed"
+    assert manifest["error"] == "Database error"
+    assert manifest["archived"] == []
+    pipeline.remove.assert_not_called()
+    pipeline.s3_client.delete_object.assert_called_once_with(
+        Bucket="archive", Key="archive/../data/lmnh_hist_data_0.csv.gz")
+
+
+@patch("etl_pipeline.get_compressor", side_effect=ValueError("zstd compression requires the zstandard package"))
+@patch("s3_data_download.setup_aws_session")
+def test_run_pipeline_checks_compression_before_extracting(mock_session, mock_get_compressor):
+    with pytest.raises(ValueError):
+        run_pipeline(parse_arguments(["-b", "bucket", "--archive-bucket", "archive",
+                                      "--compression", "zstd"]))
+
+    mock_session.assert_not_called()
+
+
+def test_get_checkpoints():
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.return_value = [
+        {"source_file": "lmnh_hist_data_0.csv", "row_offset": 10, "completed": True}]
+
+    assert get_checkpoints(mock_cursor) == {
+        "lmnh_hist_data_0.csv": {"row_offset": 10, "completed": True}}
+
+
+@patch("s3_data_download.get_exhibit_files")
+@patch("etl_pipeline.get_connection")
+@patch("etl_pipeline.get_cursor")
+@patch("etl_pipeline.reset_database")
+@patch("etl_pipeline.psycopg2.extras.execute_values",
+       side_effect=lambda cursor, query, rows, page_size: setattr(cursor, "rowcount", len(rows)))
+def test_run_pipeline_archives_rejected_rows(mock_execute_values, mock_reset, mock_get_cursor,
+                                             mock_get_connection, mock_get_exhibit_files,
+                                             tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr("etl_pipeline.REJECTS_DIR", str(tmp_path))
+    with mock_aws():
+        session = boto3.Session(region_name="us-east-1")
+        s3_client = session.client("s3")
+        for bucket in ("museum", "archive"):
+            s3_client.create_bucket(Bucket=bucket)
+        s3_client.put_object(Bucket="museum", Key="lmnh_hist_data_0.csv",
+                             Body=b"at,site,val,type\n2024-10-22 10:00:00,1,3,\n"
+                                  b"2024-10-22 10:01:00,1,abc,\n")
+
+        def download(bucket, key):
+            file_path = str(tmp_path / key)
+            bucket.download_file(key, file_path)
+            return file_path
+
+        with patch("s3_data_download.setup_aws_session", return_value=session), \
+                patch("s3_data_download.download_kiosk_file", side_effect=download):
+            run_pipeline(parse_arguments(["-b", "museum", "--archive-bucket", "archive"]))
+
+        keys = [item["Key"] for item in
+                s3_client.list_objects_v2(Bucket="archive")["Contents"]]
+        manifest_key = next(key for key in keys if key.startswith("archive/manifests/"))
+        manifest = json.loads(gzip.decompress(
+            s3_client.get_object(Bucket="archive", Key=manifest_key)["Body"].read()))
+        rejected = json.loads(gzip.decompress(
+            s3_client.get_object(Bucket="archive", Key=manifest["rejected"])["Body"].read()))
+
+    assert manifest["status"] == "succeeded"
+    assert manifest["rejected_rows"] == 1
+    assert manifest["rejected"].startswith("archive/rejected/")
+    assert rejected["source"] == "lmnh_hist_data_0.csv"
+    assert rejected["data"]["val"] == "abc"
+    assert len(mock_execute_values.call_args.args[2]) == 1
@@ -0,0 +1,169 @@
+# pylint: skip-file
+import os
+from unittest.mock import MagicMock
+import pytest
+
+from event_log import (EventLogWriter, CapturingConsumer, ReplayConsumer, read_log,
+                       list_segments, segment_name, encode_record, decode_records,
+                       SEGMENT_MAGIC)
+
+
+def make_kafka_message(offset, timestamp, value, key=None):
+    msg = MagicMock()
+    msg.error.return_value = None
+    msg.topic.return_value = "lmnh"
+    msg.partition.return_value = 0
+    msg.offset.return_value = offset
+    msg.timestamp.return_value = (1, timestamp)
+    msg.key.return_value = key
+    msg.value.return_value = value
+    return msg
+
+
+def test_encode_decode_round_trip():
+    buffer = SEGMENT_MAGIC + encode_record("lmnh", 2, 10, 1000, None, b'{"val": 1}') + \
+        encode_record("lmnh", 3, 11, 2000, b"k", None)
+
+    records = list(decode_records(buffer))
+
+    assert records == [("lmnh", 2, 10, 1000, None, b'{"val": 1}'),
+                       ("lmnh", 3, 11, 2000, b"k", None)]
+
+
+def test_decode_records_rejects_foreign_file():
+    with pytest.raises(ValueError):
+        list(decode_records(b"not a segment"))
+
+
+def test_decode_records_stops_at_truncated_record():
+    record = encode_record("lmnh", 0, 1, 1000, None, b"value")
+    records = list(decode_records(SEGMENT_MAGIC + record + record[:-2]))
+
+    assert len(records) == 1
+
+
+def test_writer_rolls_segments(tmp_path):
+    writer = EventLogWriter(str(tmp_path), segment_bytes=100)
+    for offset in range(5):
+        writer.append("lmnh", 0, offset, offset * 1000, None, b"x" * 40)
+    writer.close()
+
+    assert len(list_segments(str(tmp_path))) > 1
+    assert [msg.offset() for msg in read_log(str(tmp_path))] == [0, 1, 2, 3, 4]
+
+
+def test_capturing_consumer_tees_messages(tmp_path):
+    inner = MagicMock()
+    inner.poll.side_effect = [make_kafka_message(7, 1000, b'{"site": "1"}'), None]
+    writer = EventLogWriter(str(tmp_path))
+    consumer = CapturingConsumer(inner, writer)
+
+    first = consumer.poll(1.0)
+    second = consumer.poll(1.0)
+    consumer.close()
+
+    assert first.offset() == 7
+    assert second is None
+    inner.close.assert_called_once()
+    replayed = list(read_log(str(tmp_path)))
+    assert len(replayed) == 1
+    assert replayed[0].value() == b'{"site": "1"}'
+    assert replayed[0].timestamp() == (1, 1000)
+
+
+def test_replay_consumer_paces_at_speed(tmp_path):
+    writer = EventLogWriter(str(tmp_path))
+    writer.append("lmnh", 0, 0, 10_000, None, b"a")
+    writer.append("lmnh", 0, 1, 14_000, None, b"b")
+    writer.close()
+
+    sleeps = []
+    consumer = ReplayConsumer(str(tmp_path), speed=2, clock=lambda: 0.0,
+                              sleep=sleeps.append)
+
+    assert consumer.poll().value() == b"a"
+    assert consumer.poll().value() == b"b"
+    assert consumer.poll() is None
+    assert consumer.exhausted
+    assert sleeps == [2.0]
+
+
+def test_replay_consumer_max_speed_never_sleeps(tmp_path):
+    writer = EventLogWriter(str(tmp_path))
+    writer.append("lmnh", 0, 0, 10_000, None, b"a")
+    writer.append("lmnh", 0, 1, 90_000, None, b"b")
+    writer.close()
+
+    sleeps = []
+    consumer = ReplayConsumer(str(tmp_path), speed=0, clock=lambda: 0.0,
+                              sleep=sleeps.append)
+
+    assert consumer.poll() is not None
+    assert consumer.poll() is not None
+    assert sleeps == []
+
+
+def test_decode_records_yields_lazily():
+    record = encode_record("lmnh", 0, 1, 1000, None, b"value")
+    records = decode_records(SEGMENT_MAGIC + record + record)
+
+    assert next(records)[2] == 1
+    assert len(list(records)) == 1
+
+
+def test_writer_continues_after_gap_in_segments(tmp_path):
+    for index in (0, 3):
+        writer = EventLogWriter(str(tmp_path))
+        writer.segment_index = index
+        writer.append("lmnh", 0, index, 1000, None, b"kept")
+        writer.close()
+    os.remove(tmp_path / segment_name(0))
+
+    writer = EventLogWriter(str(tmp_path))
+    writer.append("lmnh", 0, 9, 2000, None, b"new")
+    writer.close()
+
+    assert [os.path.basename(path) for path in list_segments(str(tmp_path))] == [
+        segment_name(3), segment_name(4)]
+    assert [msg.value() for msg in read_log(str(tmp_path))] == [b"kept", b"new"]
+
+
+def test_writer_flushes_every_n_records(tmp_path):
+    writer = EventLogWriter(str(tmp_path), flush_records=2, flush_interval=3600)
+
+    writer.append("lmnh", 0, 0, 1000, None, b"a")
+    assert [msg.value() for msg in read_log(str(tmp_path))] == []
+    writer.append("lmnh", 0, 1, 2000, None, b"b")
+
+    assert [msg.value() for msg in read_log(str(tmp_path))] == [b"a", b"b"]
+    writer.close()
+
+
+def test_writer_flushes_after_interval(tmp_path):
+    now = [0.0]
+    writer = EventLogWriter(str(tmp_path), flush_records=1000, flush_interval=1.0,
+                            clock=lambda: now[0])
+
+    writer.append("lmnh", 0, 0, 1000, None, b"a")
+    now[0] = 1.5
+    writer.append("lmnh", 0, 1, 2000, None, b"b")
+
+    assert len(list(read_log(str(tmp_path)))) == 2
+    writer.close()
+
+
+def test_capturing_consumer_flushes_when_idle(tmp_path):
+    now = [0.0]
+    inner = MagicMock()
+    inner.poll.side_effect = [make_kafka_message(1, 1000, b"a"), None]
+    writer = EventLogWriter(str(tmp_path), flush_records=1000, flush_interval=1.0,
+                            clock=lambda: now[0])
+    consumer = CapturingConsumer(inner, writer)
+
+    consumer.poll(1.0)
+    assert list(read_log(str(tmp_path))) == []
+    now[0] = 2.0
+    consumer.poll(1.0)
+
+    assert len(list(read_log(str(tmp_path)))) == 1
+    writer.close()
@@ -2,7 +2,11 @@
 from unittest.mock import patch, MagicMock
 import pytest
 import logging
-from kafka_data_process import validate_message, process_message, consume_event
+import json
+from kafka_data_process import (validate_message, process_message, consume_event,
+                                replay_events, commit_offsets, get_kafka_config, main)
+from event_log import EventLogWriter
+from batch_loader import AdaptiveBatchController
 
 
 @pytest.mark.parametrize("data, expected", [
@@ -75,3 +79,155 @@ def test_process_message_no_message(mock_get_cursor, mock_get_connection):
     result = process_message(consumer, mock_get_connection, mock_get_cursor)
 
     assert result is None
+
+
+@patch("kafka_data_process.import_single_kiosk_data")
+def test_process_message_updates_live_aggregates(mock_import_single):
+    consumer = MagicMock()
+    mock_msg = MagicMock()
+    mock_msg.key.return_value = None
+    mock_msg.value.return_value = b'{"at": "2024-10-22T10:00:00+00:00", "site": "2", "val": 3}'
+    mock_msg.error.return_value = None
+    consumer.poll.return_value = mock_msg
+    aggregates = MagicMock()
+
+    process_message(consumer, MagicMock(), MagicMock(), aggregates=aggregates)
+
+    aggregates.record.assert_called_once_with(
+        {"at": "2024-10-22T10:00:00+00:00", "site": "2", "val": 3})
+    mock_import_single.assert_called_once()
+
+
+def test_process_message_passes_offset_to_writer():
+    consumer = MagicMock()
+    mock_msg = MagicMock()
+    mock_msg.key.return_value = None
+    mock_msg.value.return_value = b'{"at": "2024-10-22T10:00:00+00:00", "site": "2", "val": 3}'
+    mock_msg.error.return_value = None
+    mock_msg.topic.return_value = "lmnh"
+    mock_msg.partition.return_value = 1
+    mock_msg.offset.return_value = 42
+    consumer.poll.return_value = mock_msg
+    writer = MagicMock()
+
+    process_message(consumer, MagicMock(), MagicMock(), writer=writer)
+
+    writer.add.assert_called_once_with(
+        {"at": "2024-10-22T10:00:00+00:00", "site": "2", "val": 3}, ("lmnh", 1, 42))
+
+
+def test_commit_offsets_commits_after_latest_offset_per_partition():
+    consumer = MagicMock()
+
+    commit_offsets(consumer, [("lmnh", 0, 5), ("lmnh", 1, 3), ("lmnh", 0, 7)])
+
+    _, kwargs = consumer.commit.call_args
+    committed = {(tp.topic, tp.partition): tp.offset for tp in kwargs["offsets"]}
+    assert committed == {("lmnh", 0): 8, ("lmnh", 1): 4}
+    assert kwargs["asynchronous"] is False
+
+
+@patch.dict("os.environ", {"BOOTSTRAP_SERVERS": "b", "SECURITY_PROTOCOL": "s",
+                           "SASL_MECHANISM": "m", "USERNAME": "u", "PASSWORD": "p"})
+@patch("kafka_data_process.load_dotenv")
+def test_get_kafka_config_disables_auto_commit_for_batches(mock_load_dotenv):
+    assert "enable.auto.commit" not in get_kafka_config()
+    assert get_kafka_config(batch=True)["enable.auto.commit"] is False
+
+
+def make_message(offset):
+    msg = MagicMock()
+    msg.key.return_value = None
+    msg.value.return_value = b'{"at": "2024-10-22T10:00:00+00:00", "site": "2", "val": 3}'
+    msg.error.return_value = None
+    msg.topic.return_value = "lmnh"
+    msg.partition.return_value = 0
+    msg.offset.return_value = offset
+    return msg
+
+
+@patch("kafka_data_process.get_cursor")
+@patch("kafka_data_process.get_connection")
+@patch("etl_pipeline.import_kiosk_batch", side_effect=Exception("Database error"))
+def test_consume_event_does_not_reflush_after_sink_failure(mock_import_batch,
+                                                           mock_get_connection,
+                                                           mock_get_cursor):
+    consumer = MagicMock()
+    consumer.poll.return_value = make_message(0)
+
+    with pytest.raises(Exception, match="Database error") as raised:
+        consume_event(consumer, AdaptiveBatchController(initial_size=1))
+
+    assert mock_import_batch.call_count == 4
+    assert raised.value.__context__ is None
+    consumer.commit.assert_not_called()
+    mock_get_connection.return_value.close.assert_called_once()
+
+
+@patch("kafka_data_process.get_cursor")
+@patch("kafka_data_process.get_connection")
+@patch("etl_pipeline.import_kiosk_batch")
+def test_consume_event_flushes_on_interrupt(mock_import_batch, mock_get_connection,
+                                            mock_get_cursor):
+    consumer = MagicMock()
+    consumer.poll.side_effect = [make_message(4), KeyboardInterrupt]
+
+    with pytest.raises(KeyboardInterrupt):
+        consume_event(consumer, AdaptiveBatchController(initial_size=10))
+
+    assert len(mock_import_batch.call_args.args[0]) == 1
+    assert consumer.commit.call_args.kwargs["offsets"][0].offset == 5
+
+
+@patch("kafka_data_process.get_cursor")
+@patch("kafka_data_process.get_connection")
+@patch("etl_pipeline.import_kiosk_batch", side_effect=Exception("Database error"))
+def test_replay_events_closes_connection_after_failure(mock_import_batch,
+                                                       mock_get_connection,
+                                                       mock_get_cursor):
+    consumer = MagicMock()
+    consumer.exhausted = False
+    consumer.poll.return_value = make_message(0)
+
+    with pytest.raises(Exception, match="Database error"):
+        replay_events(consumer, AdaptiveBatchController(initial_size=1))
+
+    mock_get_cursor.return_value.close.assert_called_once()
+    mock_get_connection.return_value.close.assert_called_once()
+
+
+def test_process_message_writes_invalid_message_to_rejects():
+    consumer = MagicMock()
+    msg = make_message(9)
+    msg.value.return_value = b'{"at": "2024-10-22T10:00:00+00:00", "site": "9", "val": 3}'
+    consumer.poll.return_value = msg
+    rejects = MagicMock()
+    writer = MagicMock()
+
+    assert process_message(consumer, MagicMock(), MagicMock(), writer, rejects=rejects) is None
+
+    rejects.write.assert_called_once_with(
+        "Site must be a number between 0 and 5.",
+        '{"at": "2024-10-22T10:00:00+00:00", "site": "9", "val": 3}', "lmnh:0:9")
+    writer.add.assert_not_called()
+
+
+@patch("kafka_data_process.setup_logging")
+@patch("kafka_data_process.import_single_kiosk_data")
+@patch("kafka_data_process.get_cursor")
+@patch("kafka_data_process.get_connection")
+def test_short_replay_still_writes_live_snapshot(mock_get_connection, mock_get_cursor,
+                                                 mock_import_single, mock_setup_logging,
+                                                 tmp_path):
+    writer = EventLogWriter(str(tmp_path / "log"))
+    for offset in range(3):
+        writer.append("lmnh", 0, offset, 1000 + offset,
+                      None, b'{"at": "2024-10-22T10:00:00+00:00", "site": "2", "val": 3}')
+    writer.close()
+    snapshot_path = tmp_path / "live.json"
+
+    main(["--replay", str(tmp_path / "log"), "--speed", "0",
+          "--live-snapshot", str(snapshot_path)])
+
+    with open(snapshot_path, encoding="utf-8") as f:
+        assert json.load(f)["events"] == 3
@@ -0,0 +1,104 @@
+# pylint: skip-file
+import json
+import urllib.request
+from datetime import datetime
+import pytest
+
+from batch_loader import AdaptiveBatchController
+from live_aggregates import SiteWindow, LiveAggregates, write_snapshot, start_snapshot_server
+
+
+NOW = datetime(2024, 10, 22, 12, 0, 30).timestamp()
+
+
+def event(minutes_ago, site, val, request_type=None):
+    at = datetime.fromtimestamp(NOW - minutes_ago * 60).isoformat()
+    data = {"at": at, "site": site, "val": val}
+    if request_type is not None:
+        data["type"] = request_type
+    return data
+
+
+@pytest.fixture
+def aggregates():
+    aggregates = LiveAggregates(rating_window=60, request_window=5, clock=lambda: NOW)
+    for data in [event(0, "1", 4), event(10, "1", 2), event(90, "1", 0),
+                 event(1, "1", -1, 1), event(7, "1", -1, 1), event(2, "3", -1, 0)]:
+        aggregates.record(data)
+    return aggregates
+
+
+def test_site_window_reuses_slots_for_newer_minutes():
+    window = SiteWindow(5)
+    window.add_rating(100, 4)
+    window.add_rating(105, 2)
+
+    assert window.totals(105, 5) == {"ratings": 1, "rating_sum": 2,
+                                     "assistance": 0, "emergencies": 0}
+
+
+def test_site_window_drops_late_events():
+    window = SiteWindow(60)
+    window.add_rating(1000, 4)
+    window.add_rating(1000, 2)
+    window.add_rating(940, 1)
+    window.add_request(939, 1)
+    window.add_rating(990, 3)
+
+    assert window.totals(1000, 60) == {"ratings": 3, "rating_sum": 9,
+                                       "assistance": 0, "emergencies": 0}
+    assert window.dropped == 2
+
+
+def test_site_window_excludes_minutes_outside_window():
+    window = SiteWindow(10)
+    window.add_request(100, 1)
+    window.add_request(104, 0)
+
+    assert window.totals(105, 5)["emergencies"] == 0
+    assert window.totals(105, 5)["assistance"] == 1
+
+
+def test_snapshot(aggregates):
+    snapshot = aggregates.snapshot()
+
+    # The rating from 90 minutes ago arrived after its minute left the window
+    assert snapshot["events"] == 5
+    assert snapshot["dropped"] == 1
+    assert snapshot["sites"]["1"] == {"exhibition_id": 2, "ratings": 2,
+                                      "average_rating": 3.0, "assistance_requests": 0,
+                                      "emergencies": 1}
+    assert snapshot["sites"]["3"]["assistance_requests"] == 1
+    assert snapshot["sites"]["3"]["average_rating"] is None
+
+
+def test_snapshot_includes_batch_controller_metrics():
+    controller = AdaptiveBatchController(initial_size=50)
+    controller.record(50, 0.1)
+    aggregates = LiveAggregates(clock=lambda: NOW, controller=controller)
+
+    snapshot = aggregates.snapshot()
+
+    assert snapshot["batch_controller"]["rows"] == 50
+    assert "batch_controller" not in LiveAggregates(clock=lambda: NOW).snapshot()
+
+
+def test_write_snapshot(aggregates, tmp_path):
+    file_path = tmp_path / "live.json"
+
+    write_snapshot(aggregates, str(file_path))
+
+    assert json.loads(file_path.read_text())["sites"]["1"]["emergencies"] == 1
+
+
+def test_snapshot_server(aggregates):
+    server = start_snapshot_server(aggregates, 0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/snapshot") as response:
+            snapshot = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert snapshot["sites"]["1"]["ratings"] == 2
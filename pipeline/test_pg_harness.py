@@ -0,0 +1,52 @@
+# pylint: skip-file
+from unittest.mock import MagicMock
+
+from pg_harness import worker_database_name, schema_checksum, RollbackConnection
+
+
+def executed(conn):
+    return [call.args[0] for call in
+            conn.cursor.return_value.__enter__.return_value.execute.call_args_list]
+
+
+def test_worker_database_name():
+    assert worker_database_name("gw3") == "lmnh_test_gw3"
+    assert worker_database_name("Main-Run") == "lmnh_test_main_run"
+
+
+def test_schema_checksum_changes_with_schema(tmp_path):
+    schema = tmp_path / "schema.sql"
+    schema.write_text("CREATE TABLE a (id INT);", encoding="utf-8")
+    first = schema_checksum(str(schema))
+    schema.write_text("CREATE TABLE b (id INT);", encoding="utf-8")
+
+    assert schema_checksum(str(schema)) != first
+
+
+def test_rollback_connection_uses_savepoints():
+    conn = MagicMock()
+    wrapped = RollbackConnection(conn)
+
+    wrapped.commit()
+    wrapped.rollback()
+    wrapped.close()
+
+    assert executed(conn) == ["SAVEPOINT test_savepoint",
+                              "RELEASE SAVEPOINT test_savepoint",
+                              "SAVEPOINT test_savepoint",
+                              "ROLLBACK TO SAVEPOINT test_savepoint"]
+    conn.commit.assert_not_called()
+    conn.close.assert_not_called()
+
+
+def test_rollback_connection_cursors_point_back_to_wrapper():
+    conn = MagicMock()
+    wrapped = RollbackConnection(conn)
+
+    cursor = wrapped.cursor(cursor_factory="factory")
+    cursor.connection.rollback()
+
+    conn.cursor.assert_any_call(cursor_factory="factory")
+    assert cursor.connection is wrapped
+    assert executed(conn)[-1] == "ROLLBACK TO SAVEPOINT test_savepoint"
+    conn.rollback.assert_not_called()
@@ -0,0 +1,140 @@
+# pylint: skip-file
+import os
+import time
+import signal
+import threading
+import pytest
+
+from profiling import (stage, current_stage, stage_times, SamplingProfiler, profile_run,
+                       capture_sample, install_signal_trigger, NO_STAGE)
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_stage_tags_thread_and_records_time():
+    stage_times.clear()
+    thread_id = threading.get_ident()
+
+    with stage("load"):
+        with stage("validate"):
+            assert current_stage(thread_id) == "validate"
+        assert current_stage(thread_id) == "load"
+
+    assert current_stage(thread_id) == NO_STAGE
+    assert set(stage_times) == {"load", "validate"}
+    assert stage_times["load"] >= stage_times["validate"]
+
+
+def test_sampling_profiler_collapses_stacks_by_stage():
+    profiler = SamplingProfiler(interval=0.001, thread_id=threading.get_ident())
+    profiler.start()
+    with stage("load"):
+        busy(0.1)
+    profiler.stop()
+
+    assert profiler.sample_count > 0
+    assert profiler.stage_samples()["load"] > 0
+    load_stacks = [line for line in profiler.collapsed().splitlines()
+                   if line.startswith("stage:load;")]
+    assert any("busy (test_profiling.py:" in line for line in load_stacks)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in load_stacks)
+
+
+def test_sampling_profiler_skips_idle_untagged_threads():
+    idle = threading.Event()
+    helper = threading.Thread(target=idle.wait, name="idle-helper", daemon=True)
+    helper.start()
+    profiler = SamplingProfiler(interval=0.001, thread_id=threading.get_ident())
+
+    profiler.sample()
+    idle.set()
+
+    assert len(profiler.samples) == 1
+    assert "test_sampling_profiler_skips_idle_untagged_threads" in next(iter(profiler.samples))
+
+
+def test_top_counts_self_and_total_samples():
+    profiler = SamplingProfiler()
+    profiler.samples.update({"stage:load;main (a.py:1);insert (b.py:2)": 3,
+                             "stage:poll;main (a.py:1)": 1})
+
+    assert profiler.top(2) == [("insert (b.py:2)", 3, 3), ("main (a.py:1)", 1, 4)]
+
+
+def test_profile_run_sample_mode_writes_reports(tmp_path):
+    prefix = str(tmp_path / "profiles" / "run")
+
+    with profile_run(prefix, "sample", interval=0.001):
+        with stage("load"):
+            busy(0.05)
+
+    for suffix in (".collapsed", ".top.txt", ".stages.txt"):
+        assert os.path.exists(prefix + suffix)
+    with open(prefix + ".stages.txt", encoding="utf-8") as f:
+        assert "load" in f.read()
+
+
+def test_profile_run_cprofile_mode_writes_reports(tmp_path):
+    prefix = str(tmp_path / "run")
+
+    with profile_run(prefix, "cprofile"):
+        with stage("load"):
+            busy(0.01)
+
+    assert os.path.exists(prefix + ".pstats")
+    with open(prefix + ".top.txt", encoding="utf-8") as f:
+        assert "busy" in f.read()
+
+
+def test_profile_run_without_prefix_does_nothing(tmp_path):
+    with profile_run(None):
+        pass
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_profile_run_rejects_unknown_mode(tmp_path):
+    with pytest.raises(ValueError):
+        with profile_run(str(tmp_path / "run"), "perf"):
+            pass
+
+
+def test_capture_sample_writes_timestamped_profile(tmp_path):
+    output_prefix = capture_sample(str(tmp_path), duration=0.02, interval=0.001)
+
+    assert os.path.basename(output_prefix).startswith("profile_")
+    assert os.path.exists(output_prefix + ".collapsed")
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="SIGUSR1 not available")
+def test_signal_trigger_captures_on_demand(tmp_path):
+    previous = signal.getsignal(signal.SIGUSR1)
+    try:
+        assert install_signal_trigger(str(tmp_path), duration=0.01, interval=0.001)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        for _ in range(100):
+            if any(name.endswith(".top.txt") for name in os.listdir(tmp_path)):
+                break
+            time.sleep(0.01)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+
+    assert any(name.endswith(".collapsed") for name in os.listdir(tmp_path))
+
+
+def test_concurrent_captures_get_distinct_names(tmp_path):
+    prefixes = []
+    threads = [threading.Thread(target=lambda: prefixes.append(
+        capture_sample(str(tmp_path), duration=0.01, interval=0.001))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(prefixes)) == 2
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".collapsed")]) == 2
+
@@ -0,0 +1,129 @@
+# pylint: skip-file
+import os
+import gzip
+import json
+from datetime import datetime
+from unittest.mock import MagicMock
+import boto3
+import pytest
+from moto import mock_aws
+
+from s3_data_archive import (archive_key, archive_file, archive_manifest, upload_stream,
+                             compressed_chunks, archive_rejects, RejectWriter, MIN_PART_SIZE)
+
+
+BUCKET = "lmnh-archive"
+RUN_DATE = datetime(2024, 10, 22, 18, 30, 0)
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_archive_key_is_date_partitioned():
+    assert archive_key("processed", "kiosk_data.csv", RUN_DATE) == \
+        "archive/processed/year=2024/month=10/day=22/kiosk_data.csv.gz"
+    assert archive_key("rejected", "rejects.csv", RUN_DATE, "none") == \
+        "archive/rejected/year=2024/month=10/day=22/rejects.csv"
+
+
+def test_compressed_chunks_gzip_round_trip():
+    data = b"".join(compressed_chunks([b"at,site\n", b"2024-10-22,1\n"], "gzip"))
+
+    assert gzip.decompress(data) == b"at,site\n2024-10-22,1\n"
+
+
+def test_compressed_chunks_unknown_compression():
+    with pytest.raises(ValueError):
+        list(compressed_chunks([b"data"], "lz4"))
+
+
+def test_archive_file_uploads_and_removes_local_copy(s3_client, tmp_path):
+    file_path = tmp_path / "kiosk_data.csv"
+    file_path.write_text("at,site,val\n2024-10-22 10:00:00,1,3\n", encoding="utf-8")
+
+    key = archive_file(s3_client, BUCKET, str(file_path), "processed", RUN_DATE)
+
+    body = s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    assert key == "archive/processed/year=2024/month=10/day=22/kiosk_data.csv.gz"
+    assert gzip.decompress(body) == b"at,site,val\n2024-10-22 10:00:00,1,3\n"
+    assert not os.path.exists(file_path)
+
+
+def test_upload_stream_uses_parallel_multipart(s3_client):
+    chunks = [os.urandom(1024 * 1024) for _ in range(12)]
+
+    upload_stream(s3_client, BUCKET, "big.bin", chunks,
+                  part_size=MIN_PART_SIZE, max_workers=2, max_buffered_parts=2)
+
+    obj = s3_client.get_object(Bucket=BUCKET, Key="big.bin")
+    assert obj["Body"].read() == b"".join(chunks)
+    assert obj["ETag"].strip('"').endswith("-3")
+
+
+def test_upload_stream_aborts_failed_multipart():
+    s3_client = MagicMock()
+    s3_client.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+    s3_client.upload_part.side_effect = Exception("S3 error")
+
+    with pytest.raises(Exception):
+        upload_stream(s3_client, BUCKET, "big.bin", [b"x" * MIN_PART_SIZE, b"y"],
+                      part_size=MIN_PART_SIZE)
+
+    s3_client.abort_multipart_upload.assert_called_once_with(
+        Bucket=BUCKET, Key="big.bin", UploadId="upload-1")
+    s3_client.complete_multipart_upload.assert_not_called()
+
+
+def test_upload_stream_rejects_small_parts(s3_client):
+    with pytest.raises(ValueError):
+        upload_stream(s3_client, BUCKET, "small.bin", [b"data"], part_size=1024)
+
+
+def test_archive_manifest(s3_client):
+    key = archive_manifest(s3_client, BUCKET, {"rows": 10, "started_at": RUN_DATE},
+                           RUN_DATE)
+
+    body = s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    assert key == "archive/manifests/year=2024/month=10/day=22/manifest_20241022T183000.json.gz"
+    assert json.loads(gzip.decompress(body)) == {
+        "rows": 10, "started_at": "2024-10-22 18:30:00"}
+
+
+def test_reject_writer_creates_file_on_first_reject(tmp_path):
+    file_path = tmp_path / "rejects" / "rejects.jsonl"
+    rejects = RejectWriter(str(file_path))
+    assert not file_path.exists()
+
+    rejects.write("Site must be a number between 0 and 5.", '{"site": "9"}', "lmnh:0:4")
+    rejects.close()
+
+    record = json.loads(file_path.read_text(encoding="utf-8"))
+    assert record["reason"] == "Site must be a number between 0 and 5."
+    assert record["source"] == "lmnh:0:4"
+    assert rejects.count == 1
+
+
+def test_archive_rejects(s3_client, tmp_path):
+    rejects = RejectWriter(str(tmp_path / "rejects.jsonl"))
+    rejects.write("ValueError: bad val", {"val": "abc"}, "lmnh_hist_data_0.csv")
+
+    key = archive_rejects(s3_client, BUCKET, rejects, RUN_DATE)
+
+    body = s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    assert key == "archive/rejected/year=2024/month=10/day=22/rejects.jsonl.gz"
+    assert json.loads(gzip.decompress(body))["data"] == {"val": "abc"}
+    assert not os.path.exists(rejects.file_path)
+
+
+def test_archive_rejects_skips_empty_run(s3_client, tmp_path):
+    rejects = RejectWriter(str(tmp_path / "rejects.jsonl"))
+
+    assert archive_rejects(s3_client, BUCKET, rejects, RUN_DATE) is None
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=BUCKET)
@@ -0,0 +1,23 @@
+# pylint: skip-file
+from startup_bench import measure_command, format_results
+
+
+def test_consume_does_not_import_boto3_or_kafka():
+    result = measure_command("consume", repeat=1)
+
+    assert result["heavy_modules"] == ["psycopg2"]
+
+
+def test_extract_does_not_import_database_or_kafka():
+    result = measure_command("extract", repeat=1)
+
+    assert result["heavy_modules"] == ["boto3"]
+
+
+def test_format_results():
+    table = format_results([{"command": "consume", "wall_ms": 120.0, "import_ms": 60.5,
+                             "max_rss_mb": 25.25, "heavy_modules": ["psycopg2"]}])
+
+    assert "consume" in table
+    assert "60.5" in table
+    assert "psycopg2" in table